@@ -0,0 +1,91 @@
+"""add join path indexes
+
+Credits that repeat an artist on the same track or album are removed before
+the pairs are made unique. Each removed row is logged as a warning, and they
+are not put back on downgrade.
+
+Revision ID: 3c1f5e9a7b2d
+Revises: 48fc47ee34de
+Create Date: 2026-10-18 14:12:40.381975
+
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "3c1f5e9a7b2d"
+down_revision = "48fc47ee34de"
+branch_labels = None
+depends_on = None
+
+log = logging.getLogger("alembic.runtime.migration")
+
+
+def upgrade() -> None:
+    # an artist is credited once per track and per album, keep the first
+    # credit of any repeats before making the pairs unique
+    for table in ("track_artist", "album_artist"):
+        entity = table.split("_")[0]
+        removed = op.get_bind().execute(
+            sa.text(
+                f"""
+                DELETE FROM {table} AS later
+                USING {table} AS first
+                WHERE first.{entity}_id = later.{entity}_id
+                    AND first.artist_id = later.artist_id
+                    AND first.{table}_id < later.{table}_id
+                RETURNING later.*
+                """
+            )
+        )
+        for row in removed.mappings():
+            log.warning("Removed repeated credit from %s: %s", table, dict(row))
+
+    # artists of a track / album, and the pair must be unique
+    op.create_unique_constraint(
+        "uq_track_artist_track_id_artist_id", "track_artist", ["track_id", "artist_id"]
+    )
+    op.create_unique_constraint(
+        "uq_album_artist_album_id_artist_id", "album_artist", ["album_id", "artist_id"]
+    )
+
+    # tracks / albums of an artist
+    op.create_index(
+        "ix_track_artist_artist_id_track_id", "track_artist", ["artist_id", "track_id"]
+    )
+    op.create_index(
+        "ix_album_artist_artist_id_album_id", "album_artist", ["artist_id", "album_id"]
+    )
+
+    # tracks of a playlist, and removing tracks from a playlist
+    op.create_index(
+        "ix_playlist_track_playlist_id_track_id",
+        "playlist_track",
+        ["playlist_id", "track_id"],
+    )
+    # foreign key checks when tracks are deleted
+    op.create_index("ix_playlist_track_track_id", "playlist_track", ["track_id"])
+
+    # tracks of an album, in track order
+    op.create_index("ix_tracks_album_id_track_id", "tracks", ["album_id", "track_id"])
+
+    # playlists of a user, and foreign key checks when users are deleted
+    op.create_index("ix_playlists_user_id", "playlists", ["user_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_playlists_user_id", table_name="playlists")
+    op.drop_index("ix_tracks_album_id_track_id", table_name="tracks")
+    op.drop_index("ix_playlist_track_track_id", table_name="playlist_track")
+    op.drop_index("ix_playlist_track_playlist_id_track_id", table_name="playlist_track")
+    op.drop_index("ix_album_artist_artist_id_album_id", table_name="album_artist")
+    op.drop_index("ix_track_artist_artist_id_track_id", table_name="track_artist")
+    op.drop_constraint(
+        "uq_album_artist_album_id_artist_id", "album_artist", type_="unique"
+    )
+    op.drop_constraint(
+        "uq_track_artist_track_id_artist_id", "track_artist", type_="unique"
+    )
@@ -0,0 +1,45 @@
+"""add trigram search indexes
+
+Revision ID: 48fc47ee34de
+Revises: f9eedab3a1fb
+Create Date: 2026-10-18 10:41:53.208144
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "48fc47ee34de"
+down_revision = "f9eedab3a1fb"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # trigram indexes serve LOWER(x) LIKE '%' || :name || '%' and similarity()
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index(
+        "ix_tracks_title_trgm",
+        "tracks",
+        [sa.text("lower(title) gin_trgm_ops")],
+        postgresql_using="gin",
+    )
+    op.create_index(
+        "ix_albums_title_trgm",
+        "albums",
+        [sa.text("lower(title) gin_trgm_ops")],
+        postgresql_using="gin",
+    )
+    op.create_index(
+        "ix_artists_name_trgm",
+        "artists",
+        [sa.text("lower(name) gin_trgm_ops")],
+        postgresql_using="gin",
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_artists_name_trgm", table_name="artists")
+    op.drop_index("ix_albums_title_trgm", table_name="albums")
+    op.drop_index("ix_tracks_title_trgm", table_name="tracks")
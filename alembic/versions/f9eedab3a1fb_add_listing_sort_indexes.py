@@ -0,0 +1,29 @@
+"""add listing sort indexes
+
+Revision ID: f9eedab3a1fb
+Revises: fb70ffcd51fa
+Create Date: 2026-10-18 10:02:17.530611
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "f9eedab3a1fb"
+down_revision = "fb70ffcd51fa"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # keyset pagination sorted by name seeks on (name, id)
+    op.create_index("ix_tracks_title_track_id", "tracks", ["title", "track_id"])
+    op.create_index("ix_albums_title_album_id", "albums", ["title", "album_id"])
+    op.create_index("ix_artists_name_artist_id", "artists", ["name", "artist_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_artists_name_artist_id", table_name="artists")
+    op.drop_index("ix_albums_title_album_id", table_name="albums")
+    op.drop_index("ix_tracks_title_track_id", table_name="tracks")
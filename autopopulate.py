@@ -1,15 +1,27 @@
-from faker import Faker
-from src import database as db
+import argparse
+import collections
+import datetime
+import functools
+import json
 import os
+from concurrent.futures import ProcessPoolExecutor
+
 import dotenv
+import numpy as np
 import sqlalchemy
+from faker import Faker
 
-fake = Faker()
+from src import bulk
 
 """
-Note: Due to the interdependencies between Artist, Album, and Track, we need to insert them in a specific order
-This slows down the process, but it's the only way to ensure that the data is inserted correctly
-Users and 
+Note: Artist, Album, and Track depend on each other, so their ids are reserved
+from the table sequences up front and assigned on the client. Every table is
+then streamed in with COPY in dependency order, without a round trip per row.
+
+Rows are generated on a process pool in fixed-size partitions. Each partition
+has its own random generators, seeded from --seed, the table and the partition
+number, so the same seed and scale give the same data with any number of
+workers.
 """
 
 
@@ -25,167 +37,456 @@ def database_connection_url():
 
 engine = sqlalchemy.create_engine(database_connection_url(), use_insertmanyvalues=True)
 
+# rows at scale 1
 num_artists = 200
 num_users = 10000
 num_playlists = 14000
 num_tracks_in_playlists = 1000000
 
-genres = ["rock", "pop", "rap", "country", "jazz", "classical", "metal", "hip-hop"]
-
+# rows per partition
+artists_per_partition = 50
+users_per_partition = 5000
+playlists_per_partition = 5000
+playlist_tracks_per_partition = 250000
 
-def seed_db(engine):
-    with engine.begin() as connection:
-        first_track_id, last_track_id = add_music_data(connection)
-        first_user_id, last_user_id = add_user_data(connection)
-        add_playlists(
-            connection, first_user_id, last_user_id, first_track_id, last_track_id
-        )
+# dates are generated relative to this one rather than today, so that runs on
+# different days produce the same data
+reference_date = datetime.date(2024, 1, 1)
 
+genres = ["rock", "pop", "rap", "country", "jazz", "classical", "metal", "hip-hop"]
 
-# due to the interdependencies between Artist, Album, and Track, we need to insert them in a specific order
-# This slows down the process, but it's the only way to ensure that the data is inserted correctly
-def add_music_data(connection):
-    print(
-        "Note that due to the interdependencies between Artist, Album, and Track,\n we need to insert them in a specific order. This slows down the process, but it's the only way to ensure that the data is inserted correctly"
-    )
-    firstTrackFlag = True
-    for _ in range(num_artists):
-        if _ % 10 == 0:
-            print("Artist #" + str(_) + " created")
-
-        # create an artist, 1 in 5 artists will have a deathdate
-        if fake.random_int(min=0, max=4) == 0:
-            deathdate = fake.date_between(start_date="-100y", end_date="today")
+tables = ["artists", "users", "playlists", "playlist_track"]
+
+
+def generators(seed, table, partition):
+    """
+    Returns the Faker and numpy generators of one partition of a table.
+    """
+    fake = Faker()
+    fake.seed_instance(f"{seed}-{table}-{partition}")
+    rng = np.random.default_rng([seed, tables.index(table), partition])
+    return fake, rng
+
+
+def years_ago(years):
+    return reference_date - datetime.timedelta(days=round(years * 365.25))
+
+
+def fake_date(fake, start_date, end_date=reference_date):
+    return fake.date_between(start_date=start_date, end_date=end_date)
+
+
+def fake_title(fake):
+    return fake.sentence(nb_words=fake.random_int(min=1, max=5)).strip(".").title()
+
+
+def run_partitions(pool, fn, seed, total, size, first=0, window=8):
+    """
+    Generates `total` rows with `fn(seed, partition, start, count)` in tasks
+    of `size` rows on the pool, and yields their results in order, starting
+    from partition `first`. At most `window` tasks are queued at a time, so
+    results never pile up faster than they are consumed.
+    """
+    pending = collections.deque()
+    for partition, start in enumerate(range(0, total, size)):
+        if partition < first:
+            continue
+        count = min(size, total - start)
+        pending.append(pool.submit(fn, seed, partition, start, count))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+
+    while pending:
+        yield pending.popleft().result()
+
+
+def music_partition(seed, partition, start, count):
+    """
+    Generates artists `start` to `start + count` with their albums and tracks.
+    Albums refer to their artist by number, and tracks to their artist and to
+    their album's position in this partition.
+    """
+    fake, rng = generators(seed, "artists", partition)
+    artists = []
+    albums = []
+    tracks = []
+    for i in range(start, start + count):
+        # 1 in 5 artists will have a deathdate
+        if rng.random() < 0.2:
+            deathdate = fake_date(fake, years_ago(100))
         else:
             deathdate = None
-        artist_data = {
-            "name": fake.name(),
-            "gender": fake.random_element(elements=("M", "F", None)),
-            "birthdate": fake.date_of_birth(),
-            "deathdate": deathdate,
-        }
-        result = connection.execute(sqlalchemy.insert(db.artists), artist_data)
-        artist_id = result.inserted_primary_key[0]
-
-        # Create 5-10 albums per previously created artist
-        for _ in range(fake.random_int(min=5, max=10)):
-            album_data = {
-                "title": fake.sentence(nb_words=fake.random_int(min=1, max=5))
-                .strip(".")
-                .title(),
-                "release_date": fake.date_between(start_date="-50y", end_date="today"),
-            }
-            result = connection.execute(sqlalchemy.insert(db.albums), album_data)
-            album_id = result.inserted_primary_key[0]
+        artists.append(
+            (
+                fake.name(),
+                fake.random_element(elements=("M", "F", None)),
+                fake_date(fake, years_ago(90), years_ago(18)),
+                deathdate,
+            )
+        )
 
-            # Create association between artist and album
-            album_artist_data = {
-                "album_id": album_id,
-                "artist_id": artist_id,
-            }
-            connection.execute(sqlalchemy.insert(db.album_artist), album_artist_data)
-            album_genre = genres[fake.random_int(min=0, max=len(genres) - 1)]
-            # Create 6-10 tracks per album
-            for _ in range(fake.random_int(min=6, max=10)):
-                track_data = {
-                    "title": fake.sentence(nb_words=fake.random_int(min=1, max=5))
-                    .strip(".")
-                    .title(),
-                    "runtime": fake.random_int(min=90, max=600),
-                    "genre": album_genre,
-                    "album_id": album_id,
-                    "release_date": fake.date_between(
-                        start_date=album_data["release_date"], end_date="today"
-                    ),
-                    "vibe_score": fake.random_int(min=0, max=400),
-                }
-                result = connection.execute(sqlalchemy.insert(db.tracks), track_data)
-                track_id = result.inserted_primary_key[0]
-
-                if firstTrackFlag == True:
-                    firstTrackFlag = False
-                    firstTrackId = track_id
-
-                # Create association between artist and track
-                track_artist_data = {
-                    "track_id": track_id,
-                    "artist_id": artist_id,
-                }
-                connection.execute(
-                    sqlalchemy.insert(db.track_artist), track_artist_data
+        # catalog sizes follow a power law: most artists have released a few
+        # albums, and a few have released dozens
+        for _ in range(2 + min(int(rng.zipf(1.8)), 40)):
+            release_date = fake_date(fake, years_ago(50))
+            albums.append((i, fake_title(fake), release_date))
+            album_genre = genres[rng.integers(len(genres))]
+
+            # 6-10 tracks per album
+            for _ in range(rng.integers(6, 11)):
+                tracks.append(
+                    (
+                        i,
+                        len(albums) - 1,
+                        fake_title(fake),
+                        int(rng.integers(90, 601)),
+                        album_genre,
+                        fake_date(fake, release_date),
+                        int(rng.integers(0, 401)),
+                    )
                 )
-    lastTrackId = track_id
 
-    return firstTrackId, lastTrackId
+    return artists, albums, tracks
+
+
+def user_partition(seed, partition, start, count):
+    fake, _ = generators(seed, "users", partition)
+    return [(fake.user_name(), fake.password()) for _ in range(count)]
+
+
+def playlist_partition(num_users, seed, partition, start, count):
+    """
+    Generates playlists, referring to their user by number.
+    """
+    fake, rng = generators(seed, "playlists", partition)
+    owners = rng.integers(num_users, size=count).tolist()
+    return [(fake_title(fake), owner) for owner in owners]
+
+
+@functools.lru_cache(maxsize=1)
+def track_popularity(seed, num_tracks, exponent=0.9):
+    """
+    Returns the probability of each track being picked for a playlist. The
+    probabilities follow Zipf's law over a fixed shuffle of the tracks, so a
+    few tracks are in many playlists and most are in very few.
+    """
+    rng = np.random.default_rng([seed, len(tables)])
+    weights = np.arange(1, num_tracks + 1, dtype=float) ** -exponent
+    weights /= weights.sum()
+    return weights[rng.permutation(num_tracks)]
+
+
+def playlist_track_partition(num_playlists, num_tracks, seed, partition, start, count):
+    """
+    Generates (playlist number, track number) pairs as two arrays.
+    """
+    _, rng = generators(seed, "playlist_track", partition)
+    playlists = rng.integers(num_playlists, size=count, dtype=np.int32)
+    tracks = rng.choice(num_tracks, size=count, p=track_popularity(seed, num_tracks))
+    return playlists, tracks.astype(np.int32)
+
+
+def id_ranges(ids):
+    """
+    Compresses a list of ids into [first, last] ranges of consecutive ids.
+    """
+    ranges = []
+    for i in ids:
+        if ranges and ranges[-1][1] == i - 1:
+            ranges[-1][1] = i
+        else:
+            ranges.append([i, i])
+    return ranges
+
+
+def expand_ranges(ranges):
+    return [i for first, last in ranges for i in range(first, last + 1)]
+
+
+def save_checkpoint(path, state):
+    if path is None:
+        return
+
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(path + ".tmp", path)
+
+
+def seed_db(
+    engine,
+    scale=1.0,
+    seed=0,
+    workers=None,
+    commit_every=num_tracks_in_playlists,
+    checkpoint=None,
+):
+    """
+    Seeds the database. The catalog, users and playlists are created in one
+    transaction; the playlist entries follow in transactions of `commit_every`
+    rows. With a `checkpoint` file, progress is saved after every commit and a
+    later run with the same file picks up where this one stopped.
+    """
+    if commit_every < 1:
+        raise SystemExit("--commit-every must be at least 1")
+
+    with ProcessPoolExecutor(workers) as pool:
+        if checkpoint is not None and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                state = json.load(f)
+            if (state["scale"], state["seed"]) != (scale, seed):
+                raise SystemExit(
+                    f"{checkpoint} was written with --scale {state['scale']} "
+                    f"--seed {state['seed']}"
+                )
+            print(f"Resuming after {state['entries_done']} playlist entries")
+        else:
+            with engine.begin() as connection:
+                track_ids = add_music_data(
+                    connection, pool, seed, round(num_artists * scale)
+                )
+                user_ids = add_user_data(
+                    connection, pool, seed, round(num_users * scale)
+                )
+                playlist_ids = add_playlists(
+                    connection, pool, seed, user_ids, round(num_playlists * scale)
+                )
+            state = {
+                "scale": scale,
+                "seed": seed,
+                "playlist_ids": id_ranges(playlist_ids),
+                "track_ids": id_ranges(track_ids),
+                "entries_done": 0,
+            }
+            save_checkpoint(checkpoint, state)
+
+        fill_playlists(
+            engine,
+            pool,
+            state,
+            round(num_tracks_in_playlists * scale),
+            commit_every,
+            checkpoint,
+        )
 
 
-# 3 inserts instead of 100
-def add_user_data(connection):
-    first_user_data = {"username": fake.user_name(), "password": fake.password()}
-    result = connection.execute(sqlalchemy.insert(db.users), first_user_data)
-    firstUserId = result.inserted_primary_key[0]
+def add_music_data(connection, pool, seed, count):
+    """
+    Creates `count` artists with their albums and tracks and returns the track
+    ids.
+    """
+    artists = []
+    albums = []
+    tracks = []
+    parts = run_partitions(pool, music_partition, seed, count, artists_per_partition)
+    for part_artists, part_albums, part_tracks in parts:
+        offset = len(albums)
+        artists.extend(part_artists)
+        albums.extend(part_albums)
+        tracks.extend(
+            (track[0], track[1] + offset, *track[2:]) for track in part_tracks
+        )
 
-    user_data = [
-        {
-            "username": fake.user_name(),
-            "password": fake.password(),
-        }
-        for _ in range(num_users - 2)
-    ]
-    result = connection.execute(sqlalchemy.insert(db.users), user_data)
+    artist_ids = bulk.reserve_ids(connection, "artists", "artist_id", len(artists))
+    album_ids = bulk.reserve_ids(connection, "albums", "album_id", len(albums))
+    track_ids = bulk.reserve_ids(connection, "tracks", "track_id", len(tracks))
 
-    last_user_data = {"username": fake.user_name(), "password": fake.password()}
-    result = connection.execute(sqlalchemy.insert(db.users), last_user_data)
-    lastUserId = result.inserted_primary_key[0]
+    bulk.copy_rows(
+        connection,
+        "artists",
+        ("artist_id", "name", "gender", "birthdate", "deathdate"),
+        ((artist_id, *artist) for artist_id, artist in zip(artist_ids, artists)),
+    )
+    bulk.copy_rows(
+        connection,
+        "albums",
+        ("album_id", "title", "release_date"),
+        ((album_id, *album[1:]) for album_id, album in zip(album_ids, albums)),
+    )
+    bulk.copy_rows(
+        connection,
+        "album_artist",
+        ("album_id", "artist_id"),
+        (
+            (album_id, artist_ids[album[0]])
+            for album_id, album in zip(album_ids, albums)
+        ),
+    )
+    bulk.copy_rows(
+        connection,
+        "tracks",
+        (
+            "track_id",
+            "album_id",
+            "title",
+            "runtime",
+            "genre",
+            "release_date",
+            "vibe_score",
+        ),
+        (
+            (track_id, album_ids[track[1]], *track[2:])
+            for track_id, track in zip(track_ids, tracks)
+        ),
+    )
+    bulk.copy_rows(
+        connection,
+        "track_artist",
+        ("track_id", "artist_id"),
+        (
+            (track_id, artist_ids[track[0]])
+            for track_id, track in zip(track_ids, tracks)
+        ),
+    )
+    print(
+        f"{len(artists)} artists, {len(albums)} albums "
+        f"and {len(tracks)} tracks created"
+    )
 
-    lastUserId = result.inserted_primary_key[0]
+    return track_ids
+
+
+def add_user_data(connection, pool, seed, count):
+    """
+    Creates `count` users and returns their ids.
+    """
+    user_ids = bulk.reserve_ids(connection, "users", "user_id", count)
+    parts = run_partitions(pool, user_partition, seed, count, users_per_partition)
+    users = (user for part in parts for user in part)
+    bulk.copy_rows(
+        connection,
+        "users",
+        ("user_id", "username", "password"),
+        ((user_id, *user) for user_id, user in zip(user_ids, users)),
+    )
     print("Users created")
-    return firstUserId, lastUserId
-
-
-# bulk inserting playlists, then bulk inserting playlist_track
-def add_playlists(connection, firstUserId, lastUserId, firstTrackId, lastTrackId):
-    # create playlists
-    playlist_data = [
-        {
-            "name": fake.sentence(nb_words=fake.random_int(min=1, max=5))
-            .strip(".")
-            .title(),
-            "user_id": fake.random_int(min=firstUserId, max=lastUserId),
-        }
-        for _ in range(num_playlists)
-    ]
-    # insert first playlist and retrieve its id
-    first_playlist_id = connection.execute(
-        sqlalchemy.insert(db.playlists), playlist_data[0]
-    ).inserted_primary_key[0]
-
-    # insert the rest of the playlists
-    connection.execute(sqlalchemy.insert(db.playlists), playlist_data[1:-1])
-
-    # get the last playlist id
-    last_playlist_id = connection.execute(
-        sqlalchemy.insert(db.playlists), playlist_data[-1]
-    ).inserted_primary_key[0]
-
-    # create associations between playlists and tracks, 5-150 tracks per playlist
-    playlist_track_data = [
-        {
-            "playlist_id": fake.random_int(min=first_playlist_id, max=last_playlist_id),
-            "track_id": fake.random_int(min=firstTrackId, max=lastTrackId),
-        }
-        for _ in range(num_tracks_in_playlists)
-    ]
-
-    print("Playlists created in memory - bulk inserting into database")
-
-    # insert all values at once
-    connection.execute(sqlalchemy.insert(db.playlist_track), playlist_track_data)
+    return user_ids
+
+
+def add_playlists(connection, pool, seed, user_ids, count):
+    """
+    Creates `count` empty playlists and returns their ids.
+    """
+    playlist_ids = bulk.reserve_ids(connection, "playlists", "playlist_id", count)
+    playlists = (
+        playlist
+        for part in run_partitions(
+            pool,
+            functools.partial(playlist_partition, len(user_ids)),
+            seed,
+            count,
+            playlists_per_partition,
+        )
+        for playlist in part
+    )
+    bulk.copy_rows(
+        connection,
+        "playlists",
+        ("playlist_id", "name", "user_id"),
+        (
+            (playlist_id, name, user_ids[owner])
+            for playlist_id, (name, owner) in zip(playlist_ids, playlists)
+        ),
+    )
+
     print("Playlists created")
+    return playlist_ids
+
+
+def fill_playlists(engine, pool, state, num_entries, commit_every, checkpoint):
+    """
+    Adds `num_entries` tracks to the playlists in `state`, after the first
+    `state["entries_done"]`. Rows are generated in partitions and streamed in
+    with COPY, so memory use does not grow with `num_entries`.
+
+    Commits do not have to line up with partitions: the partition a run
+    resumes in is generated again, which gives the same rows, and the ones
+    already written are skipped.
+    """
+    playlist_ids = np.array(expand_ranges(state["playlist_ids"]))
+    track_ids = np.array(expand_ranges(state["track_ids"]))
+    first, skip = divmod(state["entries_done"], playlist_tracks_per_partition)
+
+    parts = run_partitions(
+        pool,
+        functools.partial(playlist_track_partition, len(playlist_ids), len(track_ids)),
+        state["seed"],
+        num_entries,
+        playlist_tracks_per_partition,
+        first=first,
+    )
+    connection = engine.connect()
+    try:
+        transaction = connection.begin()
+        uncommitted = 0
+        for playlists, tracks in parts:
+            rows = list(
+                zip(playlist_ids[playlists].tolist(), track_ids[tracks].tolist())
+            )
+            start, skip = skip, 0
+            while start < len(rows):
+                end = min(len(rows), start + commit_every - uncommitted)
+                bulk.copy_rows(
+                    connection,
+                    "playlist_track",
+                    ("playlist_id", "track_id"),
+                    rows[start:end],
+                )
+                uncommitted += end - start
+                state["entries_done"] += end - start
+                start = end
+                if uncommitted == commit_every:
+                    transaction.commit()
+                    save_checkpoint(checkpoint, state)
+                    transaction = connection.begin()
+                    uncommitted = 0
+
+        transaction.commit()
+        save_checkpoint(checkpoint, state)
+    finally:
+        connection.close()
+
+    print(f"{num_entries} playlist entries created")
 
 
 def main():
-    seed_db(engine)
+    parser = argparse.ArgumentParser(description="Fill the database with fake data.")
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="multiplies the number of rows in every table (default: 1)",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="the same seed and scale always generate the same data (default: 0)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="number of generator processes (default: one per CPU)",
+    )
+    parser.add_argument(
+        "--commit-every",
+        type=int,
+        default=num_tracks_in_playlists,
+        help="playlist entries written per transaction (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        help="file to save progress to, and to resume from if it exists",
+    )
+    args = parser.parse_args()
+    seed_db(
+        engine,
+        args.scale,
+        args.seed,
+        args.workers,
+        args.commit_every,
+        args.checkpoint,
+    )
 
 
 if __name__ == "__main__":
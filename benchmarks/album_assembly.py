@@ -0,0 +1,97 @@
+"""
+Compares the old and new way of assembling an album with its artists and
+tracks, for albums of growing size.
+
+    python -m benchmarks.album_assembly
+
+The old get_album joined albums, artists and tracks into one artists x tracks
+result and de-duplicated it with `dict not in list`, which is quadratic. The
+loaders fetch artists and tracks separately and group them by key, which is
+linear in the number of rows.
+"""
+import timeit
+from collections import namedtuple
+
+from src.loaders import artists_by_album, tracks_by_album
+
+JoinRow = namedtuple(
+    "JoinRow",
+    [
+        "album_id",
+        "album_title",
+        "release_date",
+        "artist_id",
+        "name",
+        "track_id",
+        "track_title",
+        "runtime",
+    ],
+)
+ArtistRow = namedtuple("ArtistRow", ["key", "artist_id", "name"])
+TrackRow = namedtuple("TrackRow", ["key", "track_id", "title", "runtime"])
+
+
+def old_assembly(result):
+    result = [row._asdict() for row in result]
+    album = {
+        "album_id": result[0]["album_id"],
+        "title": result[0]["album_title"],
+        "release_date": result[0]["release_date"],
+        "artists": [],
+        "tracks": [],
+    }
+    for row in result:
+        if {"artist_id": row["artist_id"], "name": row["name"]} not in album["artists"]:
+            album["artists"].append(
+                {"artist_id": row["artist_id"], "name": row["name"]}
+            )
+
+        track = {
+            "track_id": row["track_id"],
+            "title": row["track_title"],
+            "runtime": row["runtime"],
+        }
+        if track not in album["tracks"]:
+            album["tracks"].append(track)
+    return album
+
+
+def new_assembly(artist_rows, track_rows):
+    album = {"album_id": 1, "title": "album", "release_date": "2023-06-05"}
+    album["artists"] = artists_by_album.group(artist_rows, [1])[1]
+    album["tracks"] = tracks_by_album.group(track_rows, [1])[1]
+    return album
+
+
+def main():
+    num_artists = 4
+    print(f"{'tracks':>8} {'old ms':>10} {'new ms':>10} {'speedup':>8}")
+    for num_tracks in (10, 100, 500, 1000, 2000):
+        join_rows = [
+            JoinRow(1, "album", "2023-06-05", a, f"artist {a}", t, f"track {t}", 200)
+            for t in range(num_tracks)
+            for a in range(num_artists)
+        ]
+        artist_rows = [ArtistRow(1, a, f"artist {a}") for a in range(num_artists)]
+        track_rows = [TrackRow(1, t, f"track {t}", 200) for t in range(num_tracks)]
+
+        old = old_assembly(join_rows)
+        new = new_assembly(artist_rows, track_rows)
+        assert old["artists"] == new["artists"] and old["tracks"] == new["tracks"]
+
+        number = max(1, 2000 // num_tracks)
+        old_time = (
+            timeit.timeit(lambda: old_assembly(join_rows), number=number) / number
+        )
+        new_time = (
+            timeit.timeit(lambda: new_assembly(artist_rows, track_rows), number=number)
+            / number
+        )
+        print(
+            f"{num_tracks:>8} {old_time * 1000:>10.2f} {new_time * 1000:>10.2f} "
+            f"{old_time / new_time:>7.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
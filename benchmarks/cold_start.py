@@ -0,0 +1,50 @@
+"""
+Measures how long a fresh process takes to import the app, as on a serverless
+cold start.
+
+    python -m benchmarks.cold_start --runs 20
+
+Each run imports src.api.server in a new interpreter and reports the import
+time and whether the database engine was created along the way. Importing
+should not touch the database: the engine is created on first use, and the
+table metadata comes from src/datatypes.py instead of being reflected.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+PROBE = """
+import json, time
+start = time.perf_counter()
+import src.api.server
+elapsed = time.perf_counter() - start
+from src import database
+print(json.dumps({"seconds": elapsed, "engine": database._engine is not None}))
+"""
+
+
+def run_once():
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE], capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    results = [run_once() for _ in range(args.runs)]
+    times = sorted(r["seconds"] * 1000 for r in results)
+    print(
+        f"import src.api.server: median {statistics.median(times):.0f} ms  "
+        f"min {times[0]:.0f} ms  max {times[-1]:.0f} ms  ({args.runs} runs)"
+    )
+    print(f"engine created at import: {any(r['engine'] for r in results)}")
+
+
+if __name__ == "__main__":
+    main()
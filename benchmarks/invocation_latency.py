@@ -0,0 +1,71 @@
+"""
+Measures cold and warm invocation latency of an endpoint under each pool mode,
+the way a serverless function sees them.
+
+    python -m benchmarks.invocation_latency --path "/tracks/?limit=10" --runs 10
+
+Each run starts a new interpreter with DB_POOL_MODE set, imports the app,
+and times the first request (cold) and then --warm more requests (warm). The
+cold time includes the import. Point POSTGRES_* at the pooler you deploy
+behind to compare the modes against it.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from src.database import POOL_MODES
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+from fastapi.testclient import TestClient
+from src.api.server import app
+client = TestClient(app)
+path, warm = sys.argv[1], int(sys.argv[2])
+client.get(path)
+cold = time.perf_counter() - start
+times = []
+for _ in range(warm):
+    start = time.perf_counter()
+    client.get(path)
+    times.append(time.perf_counter() - start)
+print(json.dumps({"cold": cold, "warm": times}))
+"""
+
+
+def run_once(mode, path, warm):
+    env = dict(os.environ, DB_POOL_MODE=mode)
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE, path, str(warm)],
+        capture_output=True,
+        text=True,
+        check=True,
+        env=env,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--path", default="/tracks/?limit=10")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--warm", type=int, default=20)
+    parser.add_argument("--modes", nargs="+", default=POOL_MODES, choices=POOL_MODES)
+    args = parser.parse_args()
+
+    for mode in args.modes:
+        results = [run_once(mode, args.path, args.warm) for _ in range(args.runs)]
+        cold = [r["cold"] * 1000 for r in results]
+        warm = [t * 1000 for r in results for t in r["warm"]]
+        print(
+            f"{mode:>6}: cold median {statistics.median(cold):.1f} ms  "
+            f"warm median {statistics.median(warm):.2f} ms  "
+            f"warm max {max(warm):.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Measures weather lookup latency against the local stub provider.
+
+    python -m benchmarks.weather_latency --delay 0.5 --requests 200
+
+Every request asks for a different location so each one reaches the provider,
+then the same locations are asked for again to measure cache hits. Raise
+--delay above the client's read timeout to watch the circuit breaker open.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from src.weather import WeatherClient, WeatherUnavailable, TTLCache
+from testing.weather_stub import StubWeatherServer
+
+
+async def timed(client, location):
+    start = time.perf_counter()
+    try:
+        await client.get_async(location)
+        ok = True
+    except WeatherUnavailable:
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+def report(name, results):
+    latencies = sorted(r[0] * 1000 for r in results)
+    failures = sum(1 for r in results if not r[1])
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    print(
+        f"{name:>8}: p50 {quantiles[49]:8.2f} ms  p95 {quantiles[94]:8.2f} ms  "
+        f"p99 {quantiles[98]:8.2f} ms  max {latencies[-1]:8.2f} ms  "
+        f"failed {failures}/{len(results)}"
+    )
+
+
+async def run(args, stub):
+    client = WeatherClient(base_url=stub.url, cache=TTLCache(), shared_cache=False)
+    locations = [f"city {i}" for i in range(args.requests)]
+
+    for name in ("provider", "cached"):
+        results = await asyncio.gather(*[timed(client, l) for l in locations])
+        report(name, results)
+
+    await client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--delay", type=float, default=0.1, help="provider delay in seconds"
+    )
+    parser.add_argument("--requests", type=int, default=100)
+    args = parser.parse_args()
+
+    stub = StubWeatherServer(delay=args.delay).start()
+    try:
+        asyncio.run(run(args, stub))
+        print(f"provider requests: {stub.requests}")
+    finally:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
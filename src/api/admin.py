@@ -0,0 +1,55 @@
+import os
+import secrets
+
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.params import Query
+
+from src import slow_queries
+
+router = APIRouter()
+
+
+def check_admin_token(token):
+    expected = os.environ.get("ADMIN_TOKEN")
+    if not expected or not token or not secrets.compare_digest(token, expected):
+        raise HTTPException(status_code=403, detail="Invalid admin token.")
+
+
+@router.get("/admin/slow-queries", tags=["admin"])
+def get_slow_queries(
+    limit: int = Query(50, ge=1, le=500),
+    x_admin_token: str = Header(None),
+):
+    """
+    This endpoint returns the statements the database spent the most time on
+    since the process started, slowest in total first. Statements that only
+    differ in their values are counted together. For each statement it returns:
+    * `fingerprint`: an id for the statement.
+    * `statement`: the statement, with values replaced by `?`.
+    * `count`: the number of times it was run.
+    * `total_ms`, `mean_ms`, `p50_ms`, `p95_ms`, `max_ms`: its run time in
+    milliseconds. Percentiles cover the last 256 runs.
+    * `rows`: the number of rows it returned or changed.
+    * `slowest`: the time and parameters of its slowest run over the slow
+    query threshold, if there was one.
+    * `plan`: its last EXPLAIN plan, if it was over the threshold.
+
+    The slow query log must be enabled with `SLOW_QUERY_LOG=true`, and the
+    `X-Admin-Token` header must match `ADMIN_TOKEN`.
+    """
+    check_admin_token(x_admin_token)
+    if not slow_queries.ENABLED:
+        raise HTTPException(status_code=404, detail="Slow query log is disabled.")
+
+    return slow_queries.log.summary(limit)
+
+
+@router.delete("/admin/slow-queries", tags=["admin"])
+def clear_slow_queries(x_admin_token: str = Header(None)):
+    """
+    This endpoint clears the statements recorded so far, to start measuring
+    afresh.
+    """
+    check_admin_token(x_admin_token)
+    slow_queries.log.clear()
+    return {"message": "Slow query log cleared."}
@@ -1,16 +1,42 @@
-from fastapi import APIRouter, HTTPException
-from src import database as db, weather
+import asyncio
+from fastapi import APIRouter, HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
+from src import database as db, pagination, weather, vibe_index
+from src.pagination import ListSort
+from src.scoring import get_mood_rating, get_score, weather_ratings
+from src.loaders import AsyncLoaders
 import sqlalchemy as sa
 from fastapi.params import Query
 
 router = APIRouter()
 
 
+# sort keys for each ordering, an album is listed once per artist
+ALBUM_KEYS = {
+    ListSort.id: [("a.album_id", int), ("ar.artist_id", int)],
+    ListSort.name: [("a.title", str), ("a.album_id", int), ("ar.artist_id", int)],
+    ListSort.relevance: [
+        ("-similarity(LOWER(a.title), :name)", float),
+        ("a.album_id", int),
+        ("ar.artist_id", int),
+    ],
+}
+
+ALBUM_CURSOR_COLUMNS = {
+    ListSort.id: ["album_id", "cursor_artist_id"],
+    ListSort.name: ["title", "album_id", "cursor_artist_id"],
+    ListSort.relevance: ["cursor_rank", "album_id", "cursor_artist_id"],
+}
+
+
 @router.get("/albums/", tags=["albums"])
-def list_albums(
+async def list_albums(
+    response: Response,
     name: str = "",
     limit: int = Query(50, ge=1, le=250),
     offset: int = Query(0, ge=0),
+    cursor: str = None,
+    sort: ListSort = None,
 ):
     """
     This endpoint returns a list of albums. For each album it returns:
@@ -20,43 +46,62 @@ def list_albums(
     * `artist_names`: a comma-separated list of artists associated with the album
 
     You can filter for albums whose titles contain a string by using the
-    `name` query parameter.
-
-    The `limit` and `offset` query
-    parameters are used for pagination. The `limit` query parameter specifies the
-    maximum number of results to return. The `offset` query parameter specifies the
-    number of results to skip before returning results.
+    `name` query parameter, which is served by a trigram index. When filtering,
+    results are ranked by relevance: titles closest to the search string come
+    first. Otherwise they are sorted by id. Pass `sort` as `id`, `name` or
+    `relevance` to choose the order explicitly.
+
+    The `limit` and `cursor` query parameters are used for pagination. The
+    `limit` query parameter specifies the maximum number of results to return.
+    When there are more results, the `X-Next-Cursor` response header holds a
+    cursor to pass as `cursor` to get the next page. The `offset` query
+    parameter is still accepted and skips that many results, but deep offsets
+    are slow.
     """
 
+    name = name.lower()
+    sort = pagination.default_sort(sort, name)
+    where, order_by, params = pagination.keyset(ALBUM_KEYS[sort], cursor)
+
     list_stmt = sa.text(
-        """
-        SELECT a.album_id, a.title, a.release_date, ar.name AS artist_names
+        f"""
+        SELECT a.album_id, a.title, a.release_date, ar.name AS artist_names,
+            ar.artist_id AS cursor_artist_id, -similarity(LOWER(a.title), :name) AS cursor_rank
         FROM albums AS a
         JOIN album_artist AS aa ON aa.album_id = a.album_id
         JOIN artists AS ar ON ar.artist_id = aa.artist_id
-        WHERE LOWER(a.title) LIKE '%' || :name || '%'
+        WHERE LOWER(a.title) LIKE '%' || :name || '%' AND {where}
+        ORDER BY {order_by}
         LIMIT :limit
         OFFSET :offset
         """
     )
 
-    name = name.lower()
+    async with db.async_engine.begin() as conn:
+        result = (
+            await conn.execute(
+                list_stmt,
+                {
+                    "name": name,
+                    "limit": limit,
+                    "offset": offset,
+                    **params,
+                },
+            )
+        ).fetchall()
 
-    with db.engine.begin() as conn:
-        result = conn.execute(
-            list_stmt,
-            {
-                "name": name,
-                "limit": limit,
-                "offset": offset,
-            },
-        )
-        result = [r._asdict() for r in list(result)]
+    next_cursor = pagination.next_cursor(result, ALBUM_CURSOR_COLUMNS[sort], limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+    result = [r._asdict() for r in result]
+    for r in result:
+        del r["cursor_artist_id"], r["cursor_rank"]
     return result
 
 
 @router.get("/albums/{album_id}", tags=["albums"])
-def get_album(album_id: int):
+async def get_album(album_id: int):
     """
     This endpoint returns a single album by its identifier. For each album, the following information is returned:
     * `album_id`: the internal id of the album.
@@ -79,119 +124,33 @@ def get_album(album_id: int):
     if not db.try_parse(int, album_id):
         raise HTTPException(status_code=422, detail="Album ID must be an integer.")
 
-    # get album, artist, and track information
-    stmt = sa.text(
+    album_stmt = sa.text(
         """
-        SELECT 
-            a.album_id, a.title AS album_title, a.release_date, 
-            ar.artist_id, ar.name,
-            t.track_id, t.title AS track_title, t.runtime
-        FROM 
-            albums AS a
-            JOIN album_artist AS aa ON a.album_id = aa.album_id
-            JOIN artists AS ar ON aa.artist_id = ar.artist_id
-            JOIN tracks AS t ON a.album_id = t.album_id
-        WHERE 
-            a.album_id = :album_id
+        SELECT a.album_id, a.title, a.release_date
+        FROM albums AS a
+        WHERE a.album_id = :album_id
         """
     )
 
-    with db.engine.begin() as conn:
-        result = conn.execute(stmt, {"album_id": album_id}).fetchall()
+    async with db.async_engine.begin() as conn:
+        result = (await conn.execute(album_stmt, {"album_id": album_id})).fetchone()
         if not result:
             raise HTTPException(status_code=404, detail="Album not found.")
 
-        # convert result to list of dictionaries
-        result = [row._asdict() for row in result]
-
         # Create dictionary to represent album for json return
-        album = {
-            "album_id": result[0]["album_id"],
-            "title": result[0]["album_title"],
-            "release_date": result[0]["release_date"],
-            "artists": [],
-            "tracks": [],
-        }
-
-        # add artists and tracks to album
-        for row in result:
-            if {"artist_id": row["artist_id"], "name": row["name"]} not in album[
-                "artists"
-            ]:
-                # add artist to album if not already added
-                album["artists"].append(
-                    {"artist_id": row["artist_id"], "name": row["name"]}
-                )
-
-            if {
-                "track_id": row["track_id"],
-                "title": row["track_title"],
-                "runtime": row["runtime"],
-            } not in album["tracks"]:
-                # add track to album if not already added
-                album["tracks"].append(
-                    {
-                        "track_id": row["track_id"],
-                        "title": row["track_title"],
-                        "runtime": row["runtime"],
-                    }
-                )
-
-        return album
-
+        album = result._asdict()
 
-def get_score(weather, time, temperature, mood):
-    score = 0
+        # artists and tracks are separate queries instead of one join, which
+        # would return every artist once per track
+        loaders = AsyncLoaders(conn)
+        album["artists"] = await loaders.artists_by_album.load(album_id)
+        album["tracks"] = await loaders.tracks_by_album.load(album_id)
 
-    # TEMPERATURE
-    score += temperature * 4
-
-    # TIME OF DAY
-    if int(time.split(":")[0]) >= 18 or int(time.split(":")[0]) <= 6:
-        score += 0
-    else:
-        score += 400
-
-    # WEATHER
-    with db.engine.begin() as conn:
-        sql = """
-        SELECT weather_rating 
-        FROM weather 
-        WHERE weather = :cond
-        """
-
-        print(weather)
-        result = conn.execute(sa.text(sql), [{"cond": weather}]).fetchone()
-        score += result[0]
-
-    # MOOD
-    mood = mood.lower()
-    if mood == "happy":
-        score += 343
-    elif mood == "party":
-        score += 286
-    elif mood == "workout":
-        score += 229
-    elif mood == "focus":
-        score += 171
-    elif mood == "chill":
-        score += 114
-    elif mood == "sleep":
-        score += 57
-    elif mood == "heartbroken":
-        score += 0
-    else:
-        raise HTTPException(
-            status_code=422,
-            detail="Invalid vibe.",
-        )
-
-    print(score)
-    return score / 4
+        return album
 
 
 @router.get("/albums/recommend/", tags=["albums"])
-def recommend(
+async def recommend(
     location: str = "San Luis Obispo",
     mood: str = "Happy",
     num_tracks: int = Query(10, ge=1, le=100),
@@ -240,56 +199,78 @@ def recommend(
             detail="Vibe must be a string.",
         )
 
-    weather_data = weather.get_weather_data(location)
-    if "error" in weather_data:
-        raise HTTPException(
-            status_code=422,
-            detail=weather_data["error"],
-        )
+    # fail before any I/O if the mood is unknown
+    get_mood_rating(mood)
+
+    # the weather lookup, the in-memory indexes (which block while they are
+    # reloaded) and the database connection do not depend on each other, so
+    # they are all started at once; a pooled connection is only checked out
+    # once the weather has arrived
+    async with db.prefetch_connection() as connection:
+        try:
+            weather_data, _ = await asyncio.gather(
+                weather.get_weather_data_async(location),
+                run_in_threadpool(load_recommend_indexes),
+            )
+        except weather.WeatherUnavailable as e:
+            raise HTTPException(status_code=503, detail=str(e))
+
+        if "error" in weather_data:
+            raise HTTPException(
+                status_code=422,
+                detail=weather_data["error"],
+            )
+
+        conn = await connection()
+        async with conn.begin():
+            return await recommend_album(conn, weather_data, mood, num_tracks)
 
+
+def load_recommend_indexes():
+    weather_ratings.ensure_loaded()
+    vibe_index.album_stats.ensure_loaded()
+
+
+async def recommend_album(conn, weather_data, mood, num_tracks):
     score = get_score(
         weather_data["weather"], weather_data["time"], weather_data["temperature"], mood
     )
 
-    with db.engine.begin() as conn:
-        sql = """
-        SELECT t1.album_id, t1.title, t1.release_date, tracks.track_id, tracks.genre, tracks.title AS track_title, tracks.runtime
-        FROM tracks
-        JOIN
-        (
-        SELECT albums.album_id, albums.title, albums.release_date
-        FROM albums
-        JOIN tracks ON tracks.album_id = albums.album_id
-        GROUP BY albums.album_id
-        ORDER BY ABS(:score - AVG(tracks.vibe_score)), ABS(:num_tracks - COUNT(tracks.track_id))
-        LIMIT 1
-        ) AS t1 ON t1.album_id = tracks.album_id
-        """
-        result1 = conn.execute(
-            sa.text(sql), [{"score": score, "num_tracks": num_tracks}]
-        ).fetchall()
-
-        album_id = result1[0][0]
+    # album averages and track counts are maintained in memory, so picking the
+    # album is a lookup and the database only fetches that album's details
+    album_id = vibe_index.album_stats.nearest(score, num_tracks)
+    if album_id is None:
+        raise HTTPException(status_code=404, detail="No albums found.")
+
+    sql = """
+    SELECT albums.album_id, albums.title, albums.release_date, tracks.track_id, tracks.genre, tracks.title AS track_title, tracks.runtime
+    FROM albums
+    JOIN tracks ON tracks.album_id = albums.album_id
+    WHERE albums.album_id = :album_id
+    """
+    result1 = (await conn.execute(sa.text(sql), {"album_id": album_id})).fetchall()
+    if not result1:
+        raise HTTPException(status_code=404, detail="Album not found.")
 
-        tracks = [{"track_id": t[3], "title": t[5], "runtime": t[6]} for t in result1]
+    tracks = [{"track_id": t[3], "title": t[5], "runtime": t[6]} for t in result1]
 
-        sql = """
-        SELECT artists.artist_id, artists.name
-        FROM artists
-        JOIN album_artist ON album_artist.artist_id = artists.artist_id
-        WHERE album_artist.album_id = :album_id
-        """
-        result2 = conn.execute(sa.text(sql), [{"album_id": album_id}]).fetchall()
+    sql = """
+    SELECT artists.artist_id, artists.name
+    FROM artists
+    JOIN album_artist ON album_artist.artist_id = artists.artist_id
+    WHERE album_artist.album_id = :album_id
+    """
+    result2 = (await conn.execute(sa.text(sql), {"album_id": album_id})).fetchall()
 
-        artists = [{"artist_id": a[0], "name": a[1]} for a in result2]
+    artists = [{"artist_id": a[0], "name": a[1]} for a in result2]
 
-        album = {
-            "album_id": album_id,
-            "title": result1[0][1],
-            "release_date": result1[0][2],
-            "genre_id": result1[0][3],
-            "artists": artists,
-            "tracks": tracks,
-        }
+    album = {
+        "album_id": album_id,
+        "title": result1[0][1],
+        "release_date": result1[0][2],
+        "genre_id": result1[0][3],
+        "artists": artists,
+        "tracks": tracks,
+    }
 
-        return album
+    return album
@@ -1,16 +1,38 @@
-from fastapi import APIRouter, HTTPException
-from src import database as db
+from fastapi import APIRouter, HTTPException, Response
+from src import database as db, pagination
+from src.pagination import ListSort
+from src.loaders import AsyncLoaders
 import sqlalchemy as sa
 from fastapi.params import Query
 
 
 router = APIRouter()
 
+# sort keys for each ordering
+ARTIST_KEYS = {
+    ListSort.id: [("artist_id", int)],
+    ListSort.name: [("name", str), ("artist_id", int)],
+    ListSort.relevance: [
+        ("-similarity(LOWER(name), :name)", float),
+        ("artist_id", int),
+    ],
+}
+
+ARTIST_CURSOR_COLUMNS = {
+    ListSort.id: ["artist_id"],
+    ListSort.name: ["name", "artist_id"],
+    ListSort.relevance: ["cursor_rank", "artist_id"],
+}
+
+
 @router.get("/artists/", tags=["artists"])
-def list_artists(
+async def list_artists(
+    response: Response,
     name: str = "",
     limit: int = Query(50, ge=1, le=250),
     offset: int = Query(0, ge=0),
+    cursor: str = None,
+    sort: ListSort = None,
 ):
     """
     This endpoint returns a list of artists. For each artist it returns:
@@ -18,40 +40,57 @@ def list_artists(
     * `name`: the name of the artist
 
     You can filter for artists whose names contain a string by using the
-    `name` query parameter.
-
-    The `limit` and `offset` query
-    parameters are used for pagination. The `limit` query parameter specifies the
-    maximum number of results to return. The `offset` query parameter specifies the
-    number of results to skip before returning results.
+    `name` query parameter, which is served by a trigram index. When filtering,
+    results are ranked by relevance: names closest to the search string come
+    first. Otherwise they are sorted by id. Pass `sort` as `id`, `name` or
+    `relevance` to choose the order explicitly.
+
+    The `limit` and `cursor` query parameters are used for pagination. The
+    `limit` query parameter specifies the maximum number of results to return.
+    When there are more results, the `X-Next-Cursor` response header holds a
+    cursor to pass as `cursor` to get the next page. The `offset` query
+    parameter is still accepted and skips that many results, but deep offsets
+    are slow.
     """
 
-    list_stmt = sa.text("""
-        SELECT artist_id, name
+    name = name.lower()
+    sort = pagination.default_sort(sort, name)
+    where, order_by, params = pagination.keyset(ARTIST_KEYS[sort], cursor)
+
+    list_stmt = sa.text(f"""
+        SELECT artist_id, name, -similarity(LOWER(name), :name) AS cursor_rank
         FROM artists
-        WHERE LOWER(name) LIKE '%' || :name || '%'
+        WHERE LOWER(name) LIKE '%' || :name || '%' AND {where}
+        ORDER BY {order_by}
         LIMIT :limit
         OFFSET :offset
         """
     )
 
-    name = name.lower()
-
-    with db.engine.begin() as conn:
-
-        result = conn.execute(
-            list_stmt,
-            {
-                "name": name,
-                "limit": limit,
-                "offset": offset,
-            }
-        )
-        result = [r._asdict() for r in list(result)]
+    async with db.async_engine.begin() as conn:
+        result = (
+            await conn.execute(
+                list_stmt,
+                {
+                    "name": name,
+                    "limit": limit,
+                    "offset": offset,
+                    **params,
+                },
+            )
+        ).fetchall()
+
+    next_cursor = pagination.next_cursor(result, ARTIST_CURSOR_COLUMNS[sort], limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+    result = [r._asdict() for r in result]
+    for r in result:
+        del r["cursor_rank"]
     return result
 
 @router.get("/artists/{artist_id}", tags=["artists"])
-def get_artist(artist_id: int):
+async def get_artist(artist_id: int):
     """
     This endpoint returns a single artist by its identifier. For each artist, the following information is returned:
     * `artist_id`: the internal id of the artist.
@@ -77,86 +116,25 @@ def get_artist(artist_id: int):
     if not db.try_parse(int, artist_id):
         raise HTTPException(status_code=404, detail="Artist ID must be an integer")
 
-    # get artist and track information for artist
-    track_stmt = sa.text(
-        """
-        SELECT 
-            ar.artist_id, ar.name, ar.birthdate, ar.deathdate, ar.gender,
-            t.track_id, t.title, t.release_date
-        FROM 
-            artists AS ar
-            JOIN track_artist AS ta ON ar.artist_id = ta.artist_id
-            JOIN tracks AS t ON ta.track_id = t.track_id
-        WHERE 
-            ar.artist_id = :artist_id
-        """
-    )
-
-    # get artist and album information for artist
-    album_stmt = sa.text(
+    artist_stmt = sa.text(
         """
-        SELECT 
-            a.album_id, a.title AS album_title, a.release_date
-        FROM 
-            artists AS ar
-            JOIN album_artist AS aa ON ar.artist_id = aa.artist_id
-            JOIN albums AS a ON aa.album_id = a.album_id
-        WHERE 
-            ar.artist_id = :artist_id
+        SELECT ar.artist_id, ar.name, ar.birthdate, ar.deathdate, ar.gender
+        FROM artists AS ar
+        WHERE ar.artist_id = :artist_id
         """
     )
 
-    with db.engine.begin() as conn:
-        # get tracks and albums from database
-        track_result = conn.execute(track_stmt, {"artist_id": artist_id})
-        if track_result.rowcount == 0:
+    async with db.async_engine.begin() as conn:
+        result = (await conn.execute(artist_stmt, {"artist_id": artist_id})).fetchone()
+        if not result:
             raise HTTPException(status_code=404, detail="Artist not found")
 
-        album_result = conn.execute(album_stmt, {"artist_id": artist_id})
-
-        track_result = [row._asdict() for row in track_result]
-        album_result = [row._asdict() for row in album_result]
-
-        # Create dictionary to represent artist, will add to tracks and albums later
-        artist = {
-            "artist_id": track_result[0]["artist_id"],
-            "name": track_result[0]["name"],
-            "birthdate": track_result[0]["birthdate"],
-            "deathdate": track_result[0]["deathdate"],
-            "gender": track_result[0]["gender"],
-            "tracks": [],
-            "albums": [],
-        }
-
-        # iterate through each track, add to the artist dictionary
-        for row in track_result:
-            if {
-                "track_id": row["track_id"],
-                "title": row["title"],
-                "release_date": row["release_date"],
-            } not in artist["tracks"]:
-                # add track to artist if not already added
-                artist["tracks"].append(
-                    {
-                        "track_id": row["track_id"],
-                        "title": row["title"],
-                        "release_date": row["release_date"],
-                    }
-                )
-
-        for row in album_result:
-            if {
-                "album_id": row["album_id"],
-                "title": row["album_title"],
-                "release_date": row["release_date"],
-            } not in artist["albums"]:
-                # add album to artist if not already added
-                artist["albums"].append(
-                    {
-                        "album_id": row["album_id"],
-                        "title": row["album_title"],
-                        "release_date": row["release_date"],
-                    }
-                )
+        # Create dictionary to represent artist, tracks and albums are loaded
+        # by artist id with one query each
+        artist = result._asdict()
+
+        loaders = AsyncLoaders(conn)
+        artist["tracks"] = await loaders.tracks_by_artist.load(artist_id)
+        artist["albums"] = await loaders.albums_by_artist.load(artist_id)
 
         return artist
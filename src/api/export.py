@@ -0,0 +1,115 @@
+import json
+
+import sqlalchemy as sa
+from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
+
+from src import database as db
+
+router = APIRouter()
+
+# rows fetched from the server-side cursor and written out at a time
+EXPORT_BATCH_SIZE = 1000
+
+TRACKS_SQL = """
+SELECT t.track_id, t.title, t.runtime, t.genre, t.release_date, t.album_id,
+    t.vibe_score,
+    ARRAY(
+        SELECT ta.artist_id
+        FROM track_artist AS ta
+        WHERE ta.track_id = t.track_id
+        ORDER BY ta.track_artist_id
+    ) AS artist_ids
+FROM tracks AS t
+ORDER BY t.track_id
+"""
+
+ALBUMS_SQL = """
+SELECT a.album_id, a.title, a.release_date,
+    ARRAY(
+        SELECT aa.artist_id
+        FROM album_artist AS aa
+        WHERE aa.album_id = a.album_id
+        ORDER BY aa.album_artist_id
+    ) AS artist_ids
+FROM albums AS a
+ORDER BY a.album_id
+"""
+
+ARTISTS_SQL = """
+SELECT ar.artist_id, ar.name, ar.gender, ar.birthdate, ar.deathdate
+FROM artists AS ar
+ORDER BY ar.artist_id
+"""
+
+
+def ndjson(rows) -> str:
+    """
+    Formats rows as newline-delimited JSON, with dates in ISO format.
+    """
+    return "".join(
+        json.dumps(row._asdict(), default=lambda value: value.isoformat()) + "\n"
+        for row in rows
+    )
+
+
+async def stream_rows(sql):
+    """
+    Runs one query through a server-side cursor and yields its rows as NDJSON
+    batches, so memory use stays the same however large the table is.
+    """
+    async with db.async_engine.connect() as conn:
+        result = await conn.stream(sa.text(sql))
+        async for rows in result.partitions(EXPORT_BATCH_SIZE):
+            yield ndjson(rows)
+
+
+def export(sql):
+    return StreamingResponse(stream_rows(sql), media_type="application/x-ndjson")
+
+
+@router.get("/export/tracks", tags=["export"])
+async def export_tracks():
+    """
+    This endpoint streams every track as newline-delimited JSON, one object
+    per line, ordered by id. For each track it returns:
+    * `track_id`: the internal id of the track.
+    * `title`: the title of the track.
+    * `runtime`: the runtime of the track.
+    * `genre`: the genre of the track.
+    * `release_date`: the release date of the track.
+    * `album_id`: the id of the album of the track, if there is one.
+    * `vibe_score`: the vibe score of the track.
+    * `artist_ids`: the ids of the artists of the track.
+
+    The whole catalog is read with a single query and sent as it is read,
+    which is much cheaper than paging through `/tracks/`.
+    """
+    return export(TRACKS_SQL)
+
+
+@router.get("/export/albums", tags=["export"])
+async def export_albums():
+    """
+    This endpoint streams every album as newline-delimited JSON, one object
+    per line, ordered by id. For each album it returns:
+    * `album_id`: the internal id of the album.
+    * `title`: the title of the album.
+    * `release_date`: the release date of the album.
+    * `artist_ids`: the ids of the artists of the album.
+    """
+    return export(ALBUMS_SQL)
+
+
+@router.get("/export/artists", tags=["export"])
+async def export_artists():
+    """
+    This endpoint streams every artist as newline-delimited JSON, one object
+    per line, ordered by id. For each artist it returns:
+    * `artist_id`: the internal id of the artist.
+    * `name`: the name of the artist.
+    * `gender`: the gender of the artist.
+    * `birthdate`: the birthdate of the artist.
+    * `deathdate`: the deathdate of the artist, if applicable.
+    """
+    return export(ARTISTS_SQL)
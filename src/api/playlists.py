@@ -1,11 +1,18 @@
+import asyncio
 from fastapi import APIRouter, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 from enum import Enum
-from src import database as db, weather
+from src import database as db, weather, vibe_index
+from src.scoring import get_mood_rating, get_score, weather_ratings
+from src.loaders import AsyncLoaders
 from pydantic import BaseModel
 import sqlalchemy as sa
 
 router = APIRouter()
 
+# most tracks that can be added and removed in one request
+MAX_TRACK_CHANGES = 1000
+
 
 class PlaylistJson(BaseModel):
     name: str
@@ -13,6 +20,11 @@ class PlaylistJson(BaseModel):
     user_id: int
 
 
+class PlaylistTracksJson(BaseModel):
+    add: list[int] = []
+    remove: list[int] = []
+
+
 @router.delete("/playlists/{playlist_id}", tags=["playlists"])
 def delete_playlist(playlist_id: int):
     """
@@ -88,58 +100,8 @@ def delete_track_from_playlist(playlist_id: int, track_id: int):
         return {"message": f"Track {track_id} deleted from playlist {playlist_id}."}
 
 
-def get_score(weather, time, temperature, mood):
-    score = 0
-
-    # TEMPERATURE
-    score += temperature * 4
-
-    # TIME OF DAY
-    if int(time.split(":")[0]) >= 18 or int(time.split(":")[0]) <= 6:
-        score += 0
-    else:
-        score += 400
-
-    # WEATHER
-    with db.engine.begin() as conn:
-        sql = """
-        SELECT weather_rating 
-        FROM weather 
-        WHERE weather = :cond
-        """
-
-        print(weather)
-        result = conn.execute(sa.text(sql), [{"cond": weather}]).fetchone()
-        score += result[0]
-
-    # MOOD
-    mood = mood.lower()
-    if mood == "happy":
-        score += 343
-    elif mood == "party":
-        score += 286
-    elif mood == "workout":
-        score += 229
-    elif mood == "focus":
-        score += 171
-    elif mood == "chill":
-        score += 114
-    elif mood == "sleep":
-        score += 57
-    elif mood == "heartbroken":
-        score += 0
-    else:
-        raise HTTPException(
-            status_code=422,
-            detail="Invalid vibe.",
-        )
-
-    print(score)
-    return score / 4
-
-
 @router.get("/playlists/generate/", tags=["playlists"])
-def generate(
+async def generate(
     location: str = "San Luis Obispo",
     mood: str = "happy",
     num_tracks: int = Query(10, ge=1, le=100),
@@ -186,45 +148,67 @@ def generate(
             detail="Vibe must be a string.",
         )
 
-    weather_data = weather.get_weather_data(location)
-    if "error" in weather_data:
-        raise HTTPException(
-            status_code=422,
-            detail=weather_data["error"],
-        )
+    # fail before any I/O if the mood is unknown
+    get_mood_rating(mood)
+
+    # the weather lookup, the in-memory indexes (which block while they are
+    # reloaded) and the database connection do not depend on each other, so
+    # they are all started at once; a pooled connection is only checked out
+    # once the weather has arrived
+    async with db.prefetch_connection(isolation_level="SERIALIZABLE") as connection:
+        try:
+            weather_data, _ = await asyncio.gather(
+                weather.get_weather_data_async(location),
+                run_in_threadpool(load_generate_indexes),
+            )
+        except weather.WeatherUnavailable as e:
+            raise HTTPException(status_code=503, detail=str(e))
+
+        if "error" in weather_data:
+            raise HTTPException(
+                status_code=422,
+                detail=weather_data["error"],
+            )
+
+        conn = await connection()
+        async with conn.begin():
+            return await generate_tracks(conn, weather_data, mood, num_tracks)
+
+
+def load_generate_indexes():
+    weather_ratings.ensure_loaded()
+    vibe_index.track_index.ensure_loaded()
 
+
+async def generate_tracks(conn, weather_data, mood, num_tracks):
     score = get_score(
         weather_data["weather"], weather_data["time"], weather_data["temperature"], mood
     )
-    with db.engine.connect().execution_options(isolation_level="SERIALIZABLE") as conn:
-        with conn.begin():
-            sql = """
-            SELECT t.track_id, t.title, t.runtime, t.genre, a.artist_id, a.name
-            FROM tracks AS t
-            JOIN track_artist AS ta ON t.track_id = ta.track_id
-            JOIN artists AS a ON ta.artist_id = a.artist_id
-            ORDER BY ABS(:score - t.vibe_score)
-            LIMIT :num_tracks
-            """
-            result = conn.execute(
-                sa.text(sql), [{"score": score, "num_tracks": num_tracks}]
-            ).fetchall()
-
-            tracks = {}
-            for row in result:
-                if row[0] not in tracks:
-                    tracks[row[0]] = {
-                        "title": row[1],
-                        "runtime": row[2],
-                        "genre": row[3],
-                        "artists": [{"artist_id": row[4], "name": row[5]}],
-                    }
-                else:
-                    tracks[row[0]]["artists"].append(
-                        {"artist_id": row[4], "name": row[5]}
-                    )
+    # closest tracks by vibe score come from the in-memory index, the database
+    # only has to fill in the details for those few tracks
+    track_ids = vibe_index.track_index.nearest(score, num_tracks)
+
+    loaders = AsyncLoaders(conn)
+    found = await loaders.tracks.load_many(track_ids)
+    artists = await loaders.artists_by_track.load_many(track_ids)
+
+    # keep the tracks in the order returned by the index
+    tracks = []
+    for track_id in track_ids:
+        track = found[track_id]
+        if track is None:
+            continue
+
+        tracks.append(
+            {
+                "title": track["title"],
+                "runtime": track["runtime"],
+                "genre": track["genre"],
+                "artists": artists[track_id],
+            }
+        )
 
-            return {"tracks": list(tracks.values())}
+    return {"tracks": tracks}
 
 
 @router.put("/playlists/{playlist_id}/track/{track_id}", tags=["playlists"])
@@ -276,6 +260,90 @@ def add_track_to_playlist(playlist_id: int, track_id: int):
         return {"message": f"Track {track_id} added to playlist {playlist_id}."}
 
 
+@router.patch("/playlists/{playlist_id}/tracks", tags=["playlists"])
+def update_playlist_tracks(playlist_id: int, changes: PlaylistTracksJson):
+    """
+    This endpoint adds and removes many tracks of a playlist at once. It accepts
+    a JSON object with the following fields:
+    * `add`: a list of track ids to add to the end of the playlist, in order.
+    * `remove`: a list of track ids to remove from the playlist.
+
+    Removals are applied before additions, so a track can be moved to the end
+    of the playlist by listing it in both. Every track id must exist, otherwise
+    nothing is changed. The endpoint returns the number of tracks added and
+    removed.
+    """
+    if len(changes.add) + len(changes.remove) > MAX_TRACK_CHANGES:
+        raise HTTPException(
+            status_code=422,
+            detail=f"At most {MAX_TRACK_CHANGES} tracks can be changed at once.",
+        )
+
+    track_ids = list(set(changes.add) | set(changes.remove))
+
+    with db.engine.connect().execution_options(
+        isolation_level="REPEATABLE READ"
+    ) as conn:
+        with conn.begin():
+            playlist = conn.execute(
+                sa.select(db.playlists.c.playlist_id).where(
+                    db.playlists.c.playlist_id == playlist_id
+                )
+            ).first()
+            if not playlist:
+                raise HTTPException(
+                    status_code=422, detail=f"Playlist {playlist_id} not found"
+                )
+
+            # all track ids are checked with one query
+            found = conn.execute(
+                sa.text(
+                    """
+                    SELECT track_id
+                    FROM tracks
+                    WHERE track_id = ANY(:track_ids)
+                    """
+                ),
+                {"track_ids": track_ids},
+            ).scalars()
+            missing = sorted(set(track_ids) - set(found))
+            if missing:
+                raise HTTPException(
+                    status_code=422,
+                    detail=f"Tracks not found: {', '.join(map(str, missing))}",
+                )
+
+            removed = 0
+            if changes.remove:
+                removed = conn.execute(
+                    sa.text(
+                        """
+                        DELETE FROM playlist_track
+                        WHERE playlist_id = :playlist_id
+                            AND track_id = ANY(:track_ids)
+                        """
+                    ),
+                    {"playlist_id": playlist_id, "track_ids": changes.remove},
+                ).rowcount
+
+            if changes.add:
+                # ordinality keeps the new entries in the order they were given
+                conn.execute(
+                    sa.text(
+                        """
+                        INSERT INTO playlist_track (playlist_id, track_id)
+                        SELECT :playlist_id, t.track_id
+                        FROM unnest(CAST(:track_ids AS int[]))
+                            WITH ORDINALITY AS t(track_id, n)
+                        ORDER BY t.n
+                        """
+                    ),
+                    {"playlist_id": playlist_id, "track_ids": changes.add},
+                )
+
+        return {"added": len(changes.add), "removed": removed}
+
+
 @router.post("/playlists/", tags=["playlists"])
 def add_playlist(playlist: PlaylistJson):
     """
@@ -341,7 +409,7 @@ def add_playlist(playlist: PlaylistJson):
 
 
 @router.get("/playlists/{playlist_id}", tags=["playlists"])
-def get_playlist(playlist_id: int):
+async def get_playlist(playlist_id: int):
     """
     This endpoint returns a single playlist by its identifier. For each playlist, the following information is returned:
     * `playlist_id`: the internal id of the playlist.
@@ -357,30 +425,30 @@ def get_playlist(playlist_id: int):
     Each artist is represented by a dictionary with the following keys:
     * `artist_id`: the internal id of the artist.
     * `name`: the name of the artist.
+    * `gender`: the gender of the artist.
+    * `birthdate`: the birthdate of the artist.
+    * `deathdate`: the deathdate of the artist.
     """
-    with db.engine.connect().execution_options(
-        isolation_level="REPEATABLE READ"
-    ) as conn:
-        with conn.begin():
-            playlist = conn.execute(
-                sa.select(db.playlists).where(db.playlists.c.playlist_id == playlist_id)
+    async with db.async_engine.connect() as conn:
+        await conn.execution_options(isolation_level="REPEATABLE READ")
+        async with conn.begin():
+            playlist = (
+                await conn.execute(
+                    sa.select(db.playlists).where(
+                        db.playlists.c.playlist_id == playlist_id
+                    )
+                )
             ).fetchone()
 
             if playlist:
-                tracks = conn.execute(
-                    sa.select(db.tracks)
-                    .select_from(db.tracks.join(db.playlist_track))
-                    .where(db.playlist_track.c.playlist_id == playlist_id)
-                ).fetchall()
-                tracks = [t._asdict() for t in tracks]
-
+                # one query for the tracks and one for all of their artists
+                loaders = AsyncLoaders(conn)
+                tracks = await loaders.tracks_by_playlist.load(playlist_id)
+                artists = await loaders.artist_details_by_track.load_many(
+                    t["track_id"] for t in tracks
+                )
                 for track in tracks:
-                    artists = conn.execute(
-                        sa.select(db.artists)
-                        .select_from(db.artists.join(db.track_artist))
-                        .where(db.track_artist.c.track_id == track["track_id"])
-                    ).fetchall()
-                    track["artists"] = [a._asdict() for a in artists]
+                    track["artists"] = artists[track["track_id"]]
 
                 playlist = playlist._asdict()
                 playlist["tracks"] = tracks
@@ -0,0 +1,28 @@
+from fastapi import APIRouter
+from fastapi.params import Query
+from src import autocomplete
+
+router = APIRouter()
+
+
+@router.get("/search/autocomplete", tags=["search"])
+def complete(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=50),
+):
+    """
+    This endpoint returns artist names, album titles and track titles that
+    start with the search string, or that have a word starting with it. It is
+    meant to be called on every keystroke and is answered from memory without
+    touching the database. For each match it returns:
+    * `type`: one of `artist`, `album` or `track`.
+    * `id`: the internal id of the artist, album or track.
+    * `name`: the name of the artist or the title of the album or track.
+
+    Names that start with the search string come first, then names with a
+    later word starting with it, each in alphabetical order.
+
+    The `limit` query parameter specifies the maximum number of results to return.
+    """
+
+    return autocomplete.index.complete(q, limit)
@@ -1,6 +1,23 @@
-from fastapi import FastAPI
-from src.api import artists, tracks, albums, playlists, users
+import logging
+import os
 
+from fastapi import FastAPI, Header
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
+from src.api import artists, tracks, albums, playlists, users, search, export, admin
+from src import (
+    autocomplete,
+    database,
+    instrumentation,
+    metrics,
+    scoring,
+    slow_queries,
+    vibe_index,
+    weather,
+)
+
+logger = logging.getLogger(__name__)
 
 description = """
 Music API returns information on popular rock artists, albums, and tracks.
@@ -26,6 +43,18 @@ tags_metadata = [
         "name": "users",
         "descritpion": "Add users to the database.",
     },
+    {
+        "name": "search",
+        "description": "Autocomplete artist, album and track names.",
+    },
+    {
+        "name": "export",
+        "description": "Stream the whole catalog as newline-delimited JSON.",
+    },
+    {
+        "name": "admin",
+        "description": "Inspect the running server.",
+    },
 ]
 
 app = FastAPI(
@@ -41,13 +70,79 @@ app = FastAPI(
     openapi_tags=tags_metadata,
 )
 
+instrumentation.install()
+app.add_middleware(instrumentation.TimingMiddleware)
+if os.environ.get("CORS_ORIGINS"):
+    # listings return their next page cursor in a header, which browsers only
+    # let cross-origin scripts read when it is exposed
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=os.environ["CORS_ORIGINS"].split(","),
+        expose_headers=["X-Next-Cursor", "Server-Timing"],
+    )
+if slow_queries.ENABLED:
+    slow_queries.log.install()
+
 app.include_router(artists.router)
 app.include_router(albums.router)
 app.include_router(playlists.router)
 app.include_router(tracks.router)
 app.include_router(users.router)
+app.include_router(search.router)
+app.include_router(export.router)
+app.include_router(admin.router)
 
 
 @app.get("/")
 async def root():
     return {"message": "Welcome to the Music API. See /docs for more information."}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics(x_admin_token: str = Header(None)):
+    """
+    Metrics of this process in the Prometheus text format. The `X-Admin-Token`
+    header must match `ADMIN_TOKEN`.
+    """
+    admin.check_admin_token(x_admin_token)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+def warm_up():
+    """
+    Opens the first database connection and loads the in-memory indexes. All
+    of it would otherwise happen on first use, so a failure is logged and the
+    server starts anyway.
+    """
+    try:
+        database.warm_up()
+    except Exception:
+        logger.warning("Database is unreachable, skipping warm-up", exc_info=True)
+        return
+
+    for index in (
+        scoring.weather_ratings,
+        vibe_index.track_index,
+        vibe_index.album_stats,
+        autocomplete.index,
+    ):
+        try:
+            index.ensure_loaded()
+        except Exception:
+            logger.warning("Could not preload %s", type(index).__name__, exc_info=True)
+
+
+@app.on_event("startup")
+async def warm_up_database():
+    if database.WARM_UP:
+        await run_in_threadpool(warm_up)
+
+
+@app.on_event("shutdown")
+async def close_weather_client():
+    await weather.client.aclose()
+
+
+@app.on_event("shutdown")
+async def close_async_engine():
+    await database.dispose_async_engine()
@@ -1,7 +1,11 @@
-from fastapi import APIRouter, HTTPException
-from src import database as db
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from src import autocomplete, bulk, database as db, pagination, vibe_index
+from src.pagination import ListSort
+from pydantic import BaseModel, ValidationError
+import json
 from datetime import date
+import psycopg2
 import sqlalchemy as sa
 from datetime import date
 from fastapi.params import Query
@@ -10,11 +14,32 @@ from fastapi.params import Query
 
 router = APIRouter()
 
+# sort keys for each ordering, a track is listed once per artist
+TRACK_KEYS = {
+    ListSort.id: [("t.track_id", int), ("ar.artist_id", int)],
+    ListSort.name: [("t.title", str), ("t.track_id", int), ("ar.artist_id", int)],
+    ListSort.relevance: [
+        ("-similarity(LOWER(t.title), :name)", float),
+        ("t.track_id", int),
+        ("ar.artist_id", int),
+    ],
+}
+
+TRACK_CURSOR_COLUMNS = {
+    ListSort.id: ["track_id", "cursor_artist_id"],
+    ListSort.name: ["title", "track_id", "cursor_artist_id"],
+    ListSort.relevance: ["cursor_rank", "track_id", "cursor_artist_id"],
+}
+
+
 @router.get("/tracks/", tags=["tracks"])
-def list_tracks(
+async def list_tracks(
+    response: Response,
     name: str = "",
     limit: int = Query(50, ge=1, le=250),
     offset: int = Query(0, ge=0),
+    cursor: str = None,
+    sort: ListSort = None,
 ):
     """
     This endpoint returns a list of tracks. For each track it returns:
@@ -25,44 +50,62 @@ def list_tracks(
     * `artist_names`: a list of the names of the artists
 
     You can filter for tracks whose titles contain a string by using the
-    `name` query parameter.
-
-    The `limit` and `offset` query
-    parameters are used for pagination. The `limit` query parameter specifies the
-    maximum number of results to return. The `offset` query parameter specifies the
-    number of results to skip before returning results.
+    `name` query parameter, which is served by a trigram index. When filtering,
+    results are ranked by relevance: titles closest to the search string come
+    first. Otherwise they are sorted by id. Pass `sort` as `id`, `name` or
+    `relevance` to choose the order explicitly.
+
+    The `limit` and `cursor` query parameters are used for pagination. The
+    `limit` query parameter specifies the maximum number of results to return.
+    When there are more results, the `X-Next-Cursor` response header holds a
+    cursor to pass as `cursor` to get the next page. The `offset` query
+    parameter is still accepted and skips that many results, but deep offsets
+    are slow.
     """
 
-    list_stmt = sa.text("""
-        SELECT t.track_id, t.title, t.runtime, al.title AS album_title, ar.name AS artist_names
+    name = name.lower()
+    sort = pagination.default_sort(sort, name)
+    where, order_by, params = pagination.keyset(TRACK_KEYS[sort], cursor)
+
+    list_stmt = sa.text(f"""
+        SELECT t.track_id, t.title, t.runtime, al.title AS album_title, ar.name AS artist_names,
+            ar.artist_id AS cursor_artist_id, -similarity(LOWER(t.title), :name) AS cursor_rank
         FROM tracks AS t
         JOIN albums AS al ON t.album_id = al.album_id
         JOIN track_artist AS ta ON ta.track_id = t.track_id
         JOIN artists AS ar ON ar.artist_id = ta.artist_id
-        WHERE LOWER(t.title) LIKE '%' || :name || '%'
+        WHERE LOWER(t.title) LIKE '%' || :name || '%' AND {where}
+        ORDER BY {order_by}
         LIMIT :limit
         OFFSET :offset
         """
     )
 
-    name = name.lower()
+    async with db.async_engine.begin() as conn:
+        result = (
+            await conn.execute(
+                list_stmt,
+                {
+                    "name": name,
+                    "limit": limit,
+                    "offset": offset,
+                    **params,
+                },
+            )
+        ).fetchall()
 
-    with db.engine.begin() as conn:
+    next_cursor = pagination.next_cursor(result, TRACK_CURSOR_COLUMNS[sort], limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
 
-        result = conn.execute(
-            list_stmt,
-            {
-                "name": name,
-                "limit": limit,
-                "offset": offset,
-            }
-        )
-        result = [r._asdict() for r in list(result)]
+    result = [r._asdict() for r in result]
+    for r in result:
+        del r["cursor_artist_id"], r["cursor_rank"]
     return result
 
 
 @router.get("/tracks/{track_id}", tags=["tracks"])
-def get_track(track_id: int):
+async def get_track(track_id: int):
     """
     This endpoint returns a single track by its identifier. For each track, the following information is returned:
     * `track_id`: the internal id of the track.
@@ -97,8 +140,8 @@ def get_track(track_id: int):
     """
     )
 
-    with db.engine.begin() as conn:
-        result = conn.execute(track_stmt, {"track_id": track_id}).fetchone()
+    async with db.async_engine.begin() as conn:
+        result = (await conn.execute(track_stmt, {"track_id": track_id})).fetchone()
         if not result:
             raise HTTPException(status_code=404, detail="Track not found.")
 
@@ -106,7 +149,7 @@ def get_track(track_id: int):
         track = result._asdict()
 
         # get artists associated with track
-        result = conn.execute(artist_stmt, {"track_id": track_id}).fetchall()
+        result = (await conn.execute(artist_stmt, {"track_id": track_id})).fetchall()
 
         # create list of dictionaries to represent artists
         artists = [row._asdict() for row in result]
@@ -125,39 +168,49 @@ class TrackJson(BaseModel):
     vibe_score: int
 
 
-@router.post("/tracks/", tags=["tracks"])
-def add_track(track: TrackJson):
+def track_error(track: TrackJson):
     """
-    This endpoint is used to add a new track to the database. The following information is required:
-    * `title`: the title of the track.
-    * `album_id`: the id of the album the track belongs to, if there is one.
-    * `runtime`: the runtime of the track.
-    * `genre`: the genre of the track.
-    * `release_date`: the release date of the track.
-    * `artist_ids`: a list of the ids of the artists associated with the track.
-    * `vibe_score`: the vibe score of the track.
+    Returns why a track cannot be added, or None if its fields are valid.
     """
     # null and type checks
     if not db.try_parse(str, track.title) or track.title == None:
-        raise HTTPException(status_code=422, detail="Title cannot be null.")
+        return "Title cannot be null."
 
     if not db.try_parse(int, track.runtime) or track.runtime < 1:
-        raise HTTPException(
-            status_code=422, detail="Runtime cannot be null or less than 1."
-        )
+        return "Runtime cannot be null or less than 1."
 
     if not track.genre or not db.try_parse(str, track.genre):
-        raise HTTPException(status_code=422, detail="Genre must be a string.")
+        return "Genre must be a string."
 
     if track.release_date == None:
-        raise HTTPException(status_code=422, detail="Release year cannot be null.")
+        return "Release year cannot be null."
+
+    if not track.artist_ids:
+        return "A track needs at least one artist."
 
     if not db.try_parse(int, track.vibe_score) or (
         track.vibe_score < 1 or track.vibe_score > 400
     ):
-        raise HTTPException(
-            status_code=422, detail="Vibe score must be an integer between 1 and 400."
-        )
+        return "Vibe score must be an integer between 1 and 400."
+
+    return None
+
+
+@router.post("/tracks/", tags=["tracks"])
+def add_track(track: TrackJson):
+    """
+    This endpoint is used to add a new track to the database. The following information is required:
+    * `title`: the title of the track.
+    * `album_id`: the id of the album the track belongs to, if there is one.
+    * `runtime`: the runtime of the track.
+    * `genre`: the genre of the track.
+    * `release_date`: the release date of the track.
+    * `artist_ids`: a list of the ids of the artists associated with the track.
+    * `vibe_score`: the vibe score of the track.
+    """
+    error = track_error(track)
+    if error:
+        raise HTTPException(status_code=422, detail=error)
 
     check_artist_stmt = sa.text(
         """
@@ -227,4 +280,201 @@ def add_track(track: TrackJson):
             {"track_id": track_id, "artist_ids": track.artist_ids},
         )
 
-        return track_id
+    vibe_index.track_index.add(track_id, track.vibe_score)
+    autocomplete.index.add("track", track_id, track.title.lower())
+    if track.album_id is not None:
+        vibe_index.album_stats.add(track.album_id, track.vibe_score)
+
+    return track_id
+
+
+# most tracks accepted by one bulk request, and tracks written per transaction
+MAX_BULK_TRACKS = 50000
+BULK_CHUNK_SIZE = 1000
+
+
+def decode_line(line: bytes):
+    """
+    Decodes one line of NDJSON, returning the error instead of raising it.
+    """
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return e
+
+
+def parse_tracks(body: bytes, content_type: str) -> list:
+    """
+    Parses a JSON array or, for application/x-ndjson, one JSON object per line.
+    Returns a TrackJson or an error message for each item. A line that is not
+    valid JSON only fails its own track.
+    """
+    if content_type.startswith("application/x-ndjson"):
+        items = [decode_line(line) for line in body.splitlines() if line.strip()]
+    else:
+        try:
+            items = json.loads(body)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body is not valid JSON.")
+
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Body must be a list of tracks.")
+
+    if len(items) > MAX_BULK_TRACKS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {MAX_BULK_TRACKS} tracks can be added at once.",
+        )
+
+    tracks = []
+    for item in items:
+        if isinstance(item, ValueError):
+            tracks.append(f"Not valid JSON: {item}")
+            continue
+        try:
+            track = TrackJson.parse_obj(item)
+        except ValidationError as e:
+            error = e.errors()[0]
+            tracks.append(f"{'.'.join(map(str, error['loc']))}: {error['msg']}")
+            continue
+        tracks.append(track_error(track) or track)
+    return tracks
+
+
+@router.post("/tracks/bulk", tags=["tracks"])
+async def add_tracks(request: Request):
+    """
+    This endpoint adds many tracks at once. The body is either a JSON array of
+    tracks or, with the `application/x-ndjson` content type, one track per
+    line. Each track has the same fields as for `POST /tracks/`. Up to 50000
+    tracks can be sent in one request.
+
+    Tracks are checked and written independently, so invalid ones do not stop
+    the others. The endpoint returns one entry per track, in the order they
+    were sent:
+    * `track_id`: the id of the new track, or null if it was not added.
+    * `error`: why the track was not added, or null.
+    """
+    tracks = parse_tracks(
+        await request.body(), request.headers.get("content-type", "")
+    )
+    # the database work blocks, so keep it off the event loop
+    return await run_in_threadpool(ingest_tracks, tracks)
+
+
+def ingest_tracks(tracks):
+    results = [
+        {"track_id": None, "error": track if isinstance(track, str) else None}
+        for track in tracks
+    ]
+    valid = [i for i, track in enumerate(tracks) if not isinstance(track, str)]
+    if not valid:
+        return results
+
+    # every referenced artist and album is checked with one query each
+    artist_ids = list({a for i in valid for a in tracks[i].artist_ids})
+    album_ids = list({tracks[i].album_id for i in valid} - {None})
+    with db.engine.begin() as conn:
+        artists = set(
+            conn.execute(
+                sa.text("SELECT artist_id FROM artists WHERE artist_id = ANY(:ids)"),
+                {"ids": artist_ids},
+            ).scalars()
+        )
+        albums = set(
+            conn.execute(
+                sa.text("SELECT album_id FROM albums WHERE album_id = ANY(:ids)"),
+                {"ids": album_ids},
+            ).scalars()
+        )
+
+    checked = []
+    for i in valid:
+        track = tracks[i]
+        if not artists.issuperset(track.artist_ids):
+            results[i]["error"] = "One or more artists not found."
+        elif track.album_id is not None and track.album_id not in albums:
+            results[i]["error"] = "Album not found."
+        else:
+            checked.append(i)
+    valid = checked
+
+    for start in range(0, len(valid), BULK_CHUNK_SIZE):
+        chunk = valid[start : start + BULK_CHUNK_SIZE]
+        for i, track_id in write_chunk(tracks, chunk, results):
+            track = tracks[i]
+            results[i]["track_id"] = track_id
+            vibe_index.track_index.add(track_id, track.vibe_score)
+            autocomplete.index.add("track", track_id, track.title.lower())
+            if track.album_id is not None:
+                vibe_index.album_stats.add(track.album_id, track.vibe_score)
+
+    return results
+
+
+def write_chunk(tracks, chunk, results) -> list:
+    """
+    Writes the tracks at the indexes in `chunk` and returns (index, track_id)
+    pairs for those that were added. When the database rejects the chunk it is
+    split in half and each half is tried again, so only the tracks at fault
+    fail, each with the database's error.
+    """
+    try:
+        return list(zip(chunk, write_tracks([tracks[i] for i in chunk])))
+    # COPY runs on the raw psycopg2 cursor, so its errors are not wrapped
+    except (sa.exc.SQLAlchemyError, psycopg2.Error) as e:
+        if len(chunk) == 1:
+            cause = str(getattr(e, "orig", e)).splitlines()[0]
+            results[chunk[0]]["error"] = f"Track could not be added: {cause}"
+            return []
+
+    middle = len(chunk) // 2
+    return write_chunk(tracks, chunk[:middle], results) + write_chunk(
+        tracks, chunk[middle:], results
+    )
+
+
+def write_tracks(tracks) -> list:
+    """
+    Writes tracks and their artists in one transaction and returns their ids.
+    Ids are reserved up front so both tables can be streamed in with COPY.
+    """
+    with db.engine.begin() as conn:
+        track_ids = bulk.reserve_ids(conn, "tracks", "track_id", len(tracks))
+        bulk.copy_rows(
+            conn,
+            "tracks",
+            (
+                "track_id",
+                "title",
+                "album_id",
+                "runtime",
+                "genre",
+                "release_date",
+                "vibe_score",
+            ),
+            (
+                (
+                    track_id,
+                    track.title.lower(),
+                    track.album_id,
+                    track.runtime,
+                    track.genre,
+                    track.release_date,
+                    track.vibe_score,
+                )
+                for track_id, track in zip(track_ids, tracks)
+            ),
+        )
+        bulk.copy_rows(
+            conn,
+            "track_artist",
+            ("track_id", "artist_id"),
+            (
+                (track_id, artist_id)
+                for track_id, track in zip(track_ids, tracks)
+                # an artist is credited once per track
+                for artist_id in dict.fromkeys(track.artist_ids)
+            ),
+        )
+    return track_ids
@@ -0,0 +1,184 @@
+import bisect
+import heapq
+import itertools
+import time
+from array import array
+
+from src.vibe_index import RefreshingIndex
+
+KINDS = ("artist", "album", "track")
+
+
+class PackedKeys:
+    """
+    Read-only sequence of the keys packed into a bytes buffer, which bisect
+    can search without unpacking them.
+    """
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.blob[self.offsets[i] : self.offsets[i + 1]]
+
+
+class PrefixIndex(RefreshingIndex):
+    """
+    In-memory prefix index over artist names, album titles and track titles.
+
+    Every name is indexed under its full lowercased text and under each later
+    word, so "bea" completes "The Beatles". Full names and later words are
+    kept in two separate runs, so names that start with the prefix can be
+    returned before names that only have a word starting with it. Each run
+    is sorted and packed into one bytes buffer with an array of offsets,
+    which keeps millions of keys compact; a completion is a binary search for
+    the first key with the prefix followed by a scan of the next few keys.
+
+    Names added since the last load go into small sorted lists that are merged
+    into the results, and are folded into the packed keys on the next reload.
+    """
+
+    sql = """
+    SELECT 0, artist_id, name FROM artists
+    UNION ALL
+    SELECT 1, album_id, title FROM albums
+    UNION ALL
+    SELECT 2, track_id, title FROM tracks
+    """
+
+    def __init__(self, max_age=600, max_words=8):
+        super().__init__(max_age)
+        self.max_words = max_words
+        self._kinds = array("B")
+        self._ids = array("i")
+        self._names = []
+        self._runs = [self.pack([]), self.pack([])]
+        self._recent = [[], []]
+
+    def __len__(self):
+        return sum(len(refs) for _, _, refs in self._runs) + sum(
+            len(recent) for recent in self._recent
+        )
+
+    def keys(self, name):
+        words = name.lower().split()[: self.max_words]
+        return [" ".join(words[i:]).encode() for i in range(len(words))]
+
+    @staticmethod
+    def pack(keys):
+        """
+        Pack sorted (key, ref) pairs into a bytes buffer, its offsets and the
+        refs.
+        """
+        offsets = array("Q", [0])
+        total = 0
+        for key, _ in keys:
+            total += len(key)
+            offsets.append(total)
+        blob = b"".join(key for key, _ in keys)
+        refs = array("I", (ref for _, ref in keys))
+        return blob, offsets, refs
+
+    def load(self, rows):
+        """
+        Replace the contents of the index with (kind, id, name) rows, where kind
+        is an index into KINDS.
+        """
+        kinds = array("B")
+        ids = array("i")
+        names = []
+        leading, words = [], []
+        for kind, entity_id, name in rows:
+            ref = len(names)
+            kinds.append(kind)
+            ids.append(entity_id)
+            names.append(name)
+            keys = self.keys(name)
+            leading.extend((key, ref) for key in keys[:1])
+            words.extend((key, ref) for key in keys[1:])
+        leading.sort()
+        words.sort()
+        runs = [self.pack(leading), self.pack(words)]
+
+        with self._lock:
+            self._kinds, self._ids, self._names = kinds, ids, names
+            self._runs = runs
+            self._recent = [[], []]
+            self._loaded_at = time.monotonic()
+
+    def add(self, kind, entity_id, name):
+        """
+        Index a newly created artist, album or track. Does nothing if the index
+        has not been loaded yet.
+        """
+        with self._lock:
+            if self._loaded_at is None:
+                return
+
+            ref = len(self._names)
+            self._kinds.append(KINDS.index(kind))
+            self._ids.append(entity_id)
+            self._names.append(name)
+            for i, key in enumerate(self.keys(name)):
+                bisect.insort(self._recent[min(i, 1)], (key, ref))
+
+    def _packed(self, run, prefix):
+        blob, offsets, refs = self._runs[run]
+        keys = PackedKeys(blob, offsets)
+
+        i = bisect.bisect_left(keys, prefix)
+        while i < len(refs):
+            k = keys[i]
+            if not k.startswith(prefix):
+                return
+            yield k, refs[i]
+            i += 1
+
+    def _unpacked(self, run, prefix):
+        recent = self._recent[run]
+        i = bisect.bisect_left(recent, (prefix,))
+        while i < len(recent) and recent[i][0].startswith(prefix):
+            yield recent[i]
+            i += 1
+
+    def complete(self, prefix, k=10):
+        """
+        Return up to k names starting with `prefix`, then names with a later
+        word starting with it. Each group is in alphabetical order of the
+        matched text.
+        """
+        self.ensure_loaded()
+
+        prefix = " ".join(prefix.lower().split()).encode()
+        if not prefix:
+            return []
+
+        results = []
+        seen = set()
+        with self._lock:
+            matches = itertools.chain.from_iterable(
+                heapq.merge(self._packed(run, prefix), self._unpacked(run, prefix))
+                for run in range(len(self._runs))
+            )
+            for _, ref in matches:
+                if ref in seen:
+                    continue
+                seen.add(ref)
+                results.append(
+                    {
+                        "type": KINDS[self._kinds[ref]],
+                        "id": self._ids[ref],
+                        "name": self._names[ref],
+                    }
+                )
+                if len(results) == k:
+                    break
+
+        return results
+
+
+index = PrefixIndex()
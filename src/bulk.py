@@ -0,0 +1,68 @@
+import io
+import itertools
+
+import sqlalchemy as sa
+
+
+def reserve_ids(conn, table, column, count) -> list:
+    """
+    Reserves `count` ids from the sequence behind `table.column` and returns
+    them, so rows can be given their ids on the client and written without
+    waiting for INSERT ... RETURNING. The ids are unique even with concurrent
+    writers, and consecutive when there are none.
+    """
+    if count == 0:
+        return []
+
+    sql = """
+    SELECT nextval(pg_get_serial_sequence(:table, :column))
+    FROM generate_series(1, :count)
+    """
+    result = conn.execute(
+        sa.text(sql), {"table": table, "column": column, "count": count}
+    )
+    return [row[0] for row in result]
+
+
+def text_value(value) -> str:
+    """
+    Formats a value for COPY's text format.
+    """
+    if value is None:
+        return "\\N"
+
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def copy_rows(conn, table, columns, rows, chunk_size=50000) -> int:
+    """
+    Streams rows (tuples in `columns` order) into `table` with COPY, buffering
+    at most `chunk_size` rows in memory at a time. Runs inside the
+    connection's current transaction and returns the number of rows written.
+    """
+    copy_sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+    rows = iter(rows)
+    total = 0
+
+    with conn.connection.cursor() as cursor:
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+
+            buffer = io.StringIO()
+            for row in chunk:
+                buffer.write("\t".join(text_value(value) for value in row))
+                buffer.write("\n")
+            buffer.seek(0)
+
+            cursor.copy_expert(copy_sql, buffer)
+            total += len(chunk)
+
+    return total
@@ -1,8 +1,15 @@
+import asyncio
+import contextlib
 import os
 import io
+import threading
+import time
+import uuid
 import dotenv
 import sqlalchemy
 from datetime import datetime
+from sqlalchemy.ext.asyncio import create_async_engine
+from src import datatypes, metrics
 
 
 def database_connection_url():
@@ -26,17 +33,285 @@ def try_parse(type, val):
 # create the database engine
 
 database_url = database_connection_url()
-engine = sqlalchemy.create_engine(database_url)
-metadata_obj = sqlalchemy.MetaData()
+
+# how connections are pooled:
+#   "queue"  keeps a pool of connections open, for long-running servers
+#   "null"   opens a connection per checkout and closes it afterwards, for
+#            serverless functions behind an external pooler such as pgbouncer
+#            or Supavisor, since pooled connections die when an instance is
+#            frozen and every instance would hold its own pool
+#   "single" keeps one connection, checked with a ping before each use
+# Vercel sets VERCEL in its functions, so "null" is the default there.
+POOL_MODE = os.environ.get(
+    "DB_POOL_MODE", "null" if os.environ.get("VERCEL") else "queue"
+)
+POOL_MODES = ("queue", "null", "single")
+
+# set to "false" to skip warming up the connection pool and in-memory indexes
+# on startup; serverless functions skip it by default since it would slow
+# every cold start
+WARM_UP = os.environ.get(
+    "DB_WARM_UP", "false" if POOL_MODE == "null" else "true"
+).lower() in ("1", "true")
+
+# seconds to wait for a new connection
+CONNECT_TIMEOUT = int(os.environ.get("DB_CONNECT_TIMEOUT", 5))
+
+
+class TimedPool:
+    """
+    Pool mixin that records how long each checkout waits for a connection,
+    including the time to open one.
+    """
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            engine = "async" if self._dialect.is_async else "sync"
+            metrics.pool_wait.observe(time.perf_counter() - start, engine)
+
+
+class TimedQueuePool(TimedPool, sqlalchemy.pool.QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(TimedPool, sqlalchemy.pool.AsyncAdaptedQueuePool):
+    pass
+
+
+class TimedNullPool(TimedPool, sqlalchemy.pool.NullPool):
+    pass
+
+
+def engine_options(mode) -> dict:
+    """
+    Returns the create_engine() arguments for a pool mode.
+
+    psycopg2 never prepares statements on the server and SQLAlchemy's compiled
+    statement cache lives in the client, so both work with poolers in
+    transaction mode, where consecutive transactions may run on different
+    server connections.
+    """
+    options = {
+        "connect_args": {"connect_timeout": CONNECT_TIMEOUT},
+        "poolclass": TimedQueuePool,
+    }
+    if mode == "null":
+        options.update(poolclass=TimedNullPool)
+    elif mode == "single":
+        options.update(
+            pool_size=1, max_overflow=0, pool_pre_ping=True, pool_recycle=300
+        )
+    elif mode != "queue":
+        raise ValueError(f"DB_POOL_MODE must be one of {', '.join(POOL_MODES)}")
+    return options
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> sqlalchemy.Engine:
+    """
+    Returns the engine, creating it on first use so that importing the app does
+    not touch the database.
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = sqlalchemy.create_engine(
+                    database_url, **engine_options(POOL_MODE)
+                )
+    return _engine
+
+
+def prepared_statement_name():
+    return f"__asyncpg_{uuid.uuid4()}__"
+
+
+def async_engine_options(mode) -> dict:
+    """
+    Returns the create_async_engine() arguments for a pool mode.
+
+    Unlike psycopg2, asyncpg prepares every statement on the server and caches
+    it by name. Behind a pooler in transaction mode the next statement may run
+    on a server connection where that name is unknown or taken, so in "null"
+    mode the caches are turned off and names are made unique.
+    """
+    options = engine_options(mode)
+    options["connect_args"] = {"timeout": CONNECT_TIMEOUT}
+    if mode != "null":
+        options["poolclass"] = TimedAsyncQueuePool
+    if mode == "null":
+        options["connect_args"].update(
+            statement_cache_size=0,
+            prepared_statement_cache_size=0,
+            prepared_statement_name_func=prepared_statement_name,
+        )
+    return options
+
+
+def close_on_loop(loop, aclose, discard=None):
+    """
+    Closes a resource whose connections belong to another event loop. If that
+    loop is still running, `aclose()` is scheduled on it. A stopped loop can no
+    longer close them cleanly, so `discard()` drops them without any I/O and
+    their sockets are closed when they are garbage collected.
+    """
+    if loop is not None and loop.is_running():
+        future = asyncio.run_coroutine_threadsafe(aclose(), loop)
+        # nobody waits on the close, so retrieve its exception
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+    elif discard is not None:
+        discard()
+
+
+_async_engine = None
+_async_engine_loop = None
+
+
+def get_async_engine():
+    """
+    Returns the async engine over asyncpg, creating it on first use. asyncpg
+    connections belong to the event loop they were opened on, so the engine
+    is created again if it is used from another loop.
+    """
+    global _async_engine, _async_engine_loop
+    loop = asyncio.get_running_loop()
+    if _async_engine is None or _async_engine_loop is not loop:
+        if _async_engine is not None:
+            old = _async_engine
+            close_on_loop(
+                _async_engine_loop,
+                old.dispose,
+                lambda: old.sync_engine.dispose(close=False),
+            )
+        _async_engine = create_async_engine(
+            database_url.replace("postgresql://", "postgresql+asyncpg://", 1),
+            **async_engine_options(POOL_MODE),
+        )
+        _async_engine_loop = loop
+    return _async_engine
+
+
+async def dispose_async_engine():
+    global _async_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+
+
+@contextlib.asynccontextmanager
+async def prefetch_connection(**options):
+    """
+    Yields a function that returns an async connection with the given execution
+    options, so the caller can wait on other I/O first and await the
+    connection when it needs it. The connection is closed on exit.
+
+    In "null" mode every checkout opens a new connection, so opening it is
+    started right away and overlaps with the caller's other I/O. Pooled
+    checkouts are quick, so they wait until the connection is asked for rather
+    than hold one from the pool while the caller waits.
+    """
+
+    async def connect():
+        conn = await get_async_engine().connect()
+        if options:
+            await conn.execution_options(**options)
+        return conn
+
+    task = asyncio.ensure_future(connect()) if POOL_MODE == "null" else None
+
+    async def connection():
+        nonlocal task
+        if task is None:
+            task = asyncio.ensure_future(connect())
+        return await task
+
+    try:
+        yield connection
+    finally:
+        if task is not None:
+            try:
+                conn = await task
+            except Exception:
+                # the caller sees the error when it awaits the connection
+                pass
+            else:
+                await conn.close()
+
+
+def __getattr__(name):
+    if name == "engine":
+        return get_engine()
+    if name == "async_engine":
+        return get_async_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def pool_status(read) -> dict:
+    """
+    Returns `read(pool)` for the pool of each engine created so far, by
+    engine. Null pools keep no connections and are left out.
+    """
+    engines = {
+        ("sync",): _engine,
+        ("async",): _async_engine.sync_engine if _async_engine else None,
+    }
+    return {
+        key: read(engine.pool)
+        for key, engine in engines.items()
+        if engine is not None and isinstance(engine.pool, sqlalchemy.pool.QueuePool)
+    }
+
+
+metrics.Callback(
+    "db_pool_size",
+    "Connections the pool keeps open.",
+    ("engine",),
+    lambda: pool_status(lambda pool: pool.size()),
+)
+metrics.Callback(
+    "db_pool_checked_out",
+    "Connections in use.",
+    ("engine",),
+    lambda: pool_status(lambda pool: pool.checkedout()),
+)
+metrics.Callback(
+    "db_pool_checked_in",
+    "Idle connections in the pool.",
+    ("engine",),
+    lambda: pool_status(lambda pool: pool.checkedin()),
+)
+metrics.Callback(
+    "db_pool_overflow",
+    "Connections open beyond the pool size.",
+    ("engine",),
+    lambda: pool_status(lambda pool: max(pool.overflow(), 0)),
+)
+
+
+def warm_up():
+    """
+    Creates the engine and opens a first connection, so that the first request
+    of a long-running server does not pay for it.
+    """
+    with get_engine().connect() as conn:
+        conn.execute(sqlalchemy.text("SELECT 1"))
+
 
 # *********************************************************************************
-# autoload with None to induce a lazy load of the table metadata
-tracks = sqlalchemy.Table("tracks", metadata_obj, autoload_with=engine)
-playlists = sqlalchemy.Table("playlists", metadata_obj, autoload_with=engine)
-albums = sqlalchemy.Table("albums", metadata_obj, autoload_with=None)
-artists = sqlalchemy.Table("artists", metadata_obj, autoload_with=engine)
-track_artist = sqlalchemy.Table("track_artist", metadata_obj, autoload_with=engine)
-playlist_track = sqlalchemy.Table("playlist_track", metadata_obj, autoload_with=engine)
-album_artist = sqlalchemy.Table("album_artist", metadata_obj, autoload_with=None)
-weather = sqlalchemy.Table("weather", metadata_obj, autoload_with=None)
-users = sqlalchemy.Table("users", metadata_obj, autoload_with=None)
+# table metadata is declared in src/datatypes.py rather than reflected
+metadata_obj = datatypes.Base.metadata
+tracks = datatypes.Tracks.__table__
+playlists = datatypes.Playlists.__table__
+albums = datatypes.Albums.__table__
+artists = datatypes.Artists.__table__
+track_artist = datatypes.Track_Artist.__table__
+playlist_track = datatypes.Playlist_Track.__table__
+album_artist = datatypes.Album_Artist.__table__
+weather = datatypes.Weather.__table__
+users = datatypes.Users.__table__
@@ -1,4 +1,5 @@
 import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -6,6 +7,14 @@ Base = declarative_base()
 
 class Albums(Base):
     __tablename__ = "albums"
+    __table_args__ = (
+        sa.Index("ix_albums_title_album_id", "title", "album_id"),
+        sa.Index(
+            "ix_albums_title_trgm",
+            sa.text("lower(title) gin_trgm_ops"),
+            postgresql_using="gin",
+        ),
+    )
     album_id = sa.Column(sa.Integer, primary_key=True)
     title = sa.Column(sa.Text, nullable=False)
     release_date = sa.Column(sa.Date, nullable=False)
@@ -13,6 +22,14 @@ class Albums(Base):
 
 class Artists(Base):
     __tablename__ = "artists"
+    __table_args__ = (
+        sa.Index("ix_artists_name_artist_id", "name", "artist_id"),
+        sa.Index(
+            "ix_artists_name_trgm",
+            sa.text("lower(name) gin_trgm_ops"),
+            postgresql_using="gin",
+        ),
+    )
     artist_id = sa.Column(sa.Integer, primary_key=True)
     name = sa.Column(sa.Text, nullable=False)
     gender = sa.Column(sa.Text, nullable=True)
@@ -22,6 +39,15 @@ class Artists(Base):
 
 class Tracks(Base):
     __tablename__ = "tracks"
+    __table_args__ = (
+        sa.Index("ix_tracks_title_track_id", "title", "track_id"),
+        sa.Index("ix_tracks_album_id_track_id", "album_id", "track_id"),
+        sa.Index(
+            "ix_tracks_title_trgm",
+            sa.text("lower(title) gin_trgm_ops"),
+            postgresql_using="gin",
+        ),
+    )
     track_id = sa.Column(sa.Integer, primary_key=True)
     title = sa.Column(sa.Text, nullable=False)
     runtime = sa.Column(sa.Integer, nullable=False)
@@ -38,8 +64,18 @@ class Weather(Base):
     weather_rating = sa.Column(sa.Integer, nullable=False)
 
 
+class Weather_Cache(Base):
+    __tablename__ = "weather_cache"
+    location_key = sa.Column(sa.Text, primary_key=True)
+    data = sa.Column(postgresql.JSONB, nullable=False)
+    fetched_at = sa.Column(
+        sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False
+    )
+
+
 class Playlists(Base):
     __tablename__ = "playlists"
+    __table_args__ = (sa.Index("ix_playlists_user_id", "user_id"),)
     playlist_id = sa.Column(sa.Integer, primary_key=True)
     name = sa.Column(sa.Text, nullable=False)
     user_id = sa.Column(sa.ForeignKey("users.user_id"), nullable=False)
@@ -47,6 +83,10 @@ class Playlists(Base):
 
 class Playlist_Track(Base):
     __tablename__ = "playlist_track"
+    __table_args__ = (
+        sa.Index("ix_playlist_track_playlist_id_track_id", "playlist_id", "track_id"),
+        sa.Index("ix_playlist_track_track_id", "track_id"),
+    )
     playlist_track_id = sa.Column(sa.Integer, primary_key=True)
     playlist_id = sa.Column(
         sa.ForeignKey("playlists.playlist_id", ondelete="CASCADE"), nullable=False
@@ -56,6 +96,12 @@ class Playlist_Track(Base):
 
 class Album_Artist(Base):
     __tablename__ = "album_artist"
+    __table_args__ = (
+        sa.UniqueConstraint(
+            "album_id", "artist_id", name="uq_album_artist_album_id_artist_id"
+        ),
+        sa.Index("ix_album_artist_artist_id_album_id", "artist_id", "album_id"),
+    )
     album_artist_id = sa.Column(sa.Integer, primary_key=True)
     album_id = sa.Column(sa.ForeignKey("albums.album_id"), nullable=False)
     artist_id = sa.Column(sa.ForeignKey("artists.artist_id"), nullable=False)
@@ -63,6 +109,12 @@ class Album_Artist(Base):
 
 class Track_Artist(Base):
     __tablename__ = "track_artist"
+    __table_args__ = (
+        sa.UniqueConstraint(
+            "track_id", "artist_id", name="uq_track_artist_track_id_artist_id"
+        ),
+        sa.Index("ix_track_artist_artist_id_track_id", "artist_id", "track_id"),
+    )
     track_artist_id = sa.Column(sa.Integer, primary_key=True)
     track_id = sa.Column(sa.ForeignKey("tracks.track_id"), nullable=False)
     artist_id = sa.Column(sa.ForeignKey("artists.artist_id"), nullable=False)
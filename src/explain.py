@@ -0,0 +1,76 @@
+import json
+
+import sqlalchemy as sa
+
+
+def explain(conn, statement, params=None, analyze=False) -> dict:
+    """
+    Returns the root node of a statement's plan from EXPLAIN (FORMAT JSON).
+
+    With `analyze` the statement is run, and the plan includes actual row
+    counts, times and buffer hits. Run writes inside a transaction that is
+    rolled back.
+    """
+    options = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "FORMAT JSON"
+    if isinstance(statement, str):
+        statement = sa.text(statement)
+
+    # statements built with sa.select() and friends carry their own values,
+    # and an insert() without values only sets the columns it is given
+    params = params or {}
+    compiled = statement.compile(dialect=conn.dialect, column_keys=list(params))
+    params = {**compiled.params, **params}
+    plan = conn.exec_driver_sql(f"EXPLAIN ({options}) {compiled}", params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+
+def nodes(plan):
+    """
+    Yields every node of a plan, parents before their children.
+    """
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from nodes(child)
+
+
+def shape(plan, depth=0) -> list:
+    """
+    Describes a plan as one indented line per node, naming the tables and
+    indexes it reads, without costs or row counts.
+    """
+    label = plan["Node Type"]
+    if "Index Name" in plan:
+        label += f" using {plan['Index Name']}"
+    if "Relation Name" in plan:
+        label += f" on {plan['Relation Name']}"
+
+    lines = ["  " * depth + label]
+    for child in plan.get("Plans", []):
+        lines.extend(shape(child, depth + 1))
+    return lines
+
+
+def seq_scans(plan) -> list:
+    """
+    Returns the tables a plan reads with a sequential scan.
+    """
+    return [
+        node["Relation Name"] for node in nodes(plan) if node["Node Type"] == "Seq Scan"
+    ]
+
+
+def unindexed_tables(conn, statement, params=None) -> list:
+    """
+    Returns the tables `statement` can only read with a sequential scan.
+
+    Sequential scans are disabled while planning. On a small test database,
+    where scanning a table is cheaper than using an index, a table then only
+    shows up when no index fits the query at all.
+    """
+    conn.execute(sa.text("SET LOCAL enable_seqscan = off"))
+    try:
+        return seq_scans(explain(conn, statement, params))
+    finally:
+        conn.execute(sa.text("SET LOCAL enable_seqscan = on"))
@@ -0,0 +1,177 @@
+import json
+import logging
+import os
+import time
+from contextvars import ContextVar
+
+import sqlalchemy as sa
+
+from src import metrics
+
+logger = logging.getLogger(__name__)
+
+# requests that run more queries, or take longer in milliseconds, are logged
+# as warnings
+QUERY_BUDGET = int(os.environ.get("REQUEST_QUERY_BUDGET", 50))
+TIME_BUDGET = float(os.environ.get("REQUEST_TIME_BUDGET_MS", 1000))
+
+
+class RequestStats:
+    """
+    Database work done while handling one request.
+    """
+
+    __slots__ = ("start", "queries", "db_time", "checkouts")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.checkouts = 0
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def server_timing(self) -> str:
+        """
+        Formats the stats as a Server-Timing header value, in milliseconds.
+        """
+        return (
+            f'db;dur={self.db_time * 1000:.2f};desc="{self.queries} queries, '
+            f'{self.checkouts} checkouts", total;dur={self.elapsed() * 1000:.2f}'
+        )
+
+
+# set for the duration of each request, and shared with the threads and
+# tasks the request starts, which copy the context
+current = ContextVar("request_stats", default=None)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current.get()
+    if stats is not None:
+        stats.queries += 1
+        context.instrumentation_start = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current.get()
+    start = getattr(context, "instrumentation_start", None)
+    if stats is not None and start is not None:
+        stats.db_time += time.perf_counter() - start
+
+
+def checkout(dbapi_connection, connection_record, connection_proxy):
+    stats = current.get()
+    if stats is not None:
+        stats.checkouts += 1
+
+
+def install():
+    """
+    Counts the queries and pool checkouts of every engine, including the
+    async engine and engines created later, towards the current request.
+    """
+    events = (
+        (sa.engine.Engine, "before_cursor_execute", before_cursor_execute),
+        (sa.engine.Engine, "after_cursor_execute", after_cursor_execute),
+        (sa.pool.Pool, "checkout", checkout),
+    )
+    for target, name, fn in events:
+        if not sa.event.contains(target, name, fn):
+            sa.event.listen(target, name, fn)
+
+
+def route_path(scope) -> str:
+    """
+    Returns the path template of the route that handled a request, so that
+    requests for different ids are reported together.
+    """
+    endpoint = scope.get("endpoint")
+    if endpoint not in route_paths:
+        # no route matched, don't report every unknown path separately
+        route_paths[endpoint] = "unmatched"
+        for route in scope["app"].routes:
+            if endpoint is not None and getattr(route, "endpoint", None) is endpoint:
+                route_paths[endpoint] = route.path
+    return route_paths[endpoint]
+
+
+route_paths = {}
+
+
+def over_budget(stats, duration) -> list:
+    reasons = []
+    if stats.queries > QUERY_BUDGET:
+        reasons.append(f"{stats.queries} queries, budget {QUERY_BUDGET}")
+    if duration > TIME_BUDGET:
+        reasons.append(f"{duration:.0f} ms, budget {TIME_BUDGET:.0f} ms")
+    return reasons
+
+
+class TimingMiddleware:
+    """
+    Reports the queries, pool checkouts and database time of each request in
+    a Server-Timing header and a JSON log line, and records its latency in
+    the `http_request_duration_seconds` metric.
+
+    The header is sent before a streamed body is, so for streamed responses
+    it only covers the work done before the first chunk. The log line covers
+    the whole request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current.set(stats)
+        status = 500
+        metrics.requests_in_flight.inc(scope["method"])
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", stats.server_timing().encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current.reset(token)
+            metrics.requests_in_flight.dec(scope["method"])
+            record_request(scope, status, stats)
+
+
+def record_request(scope, status, stats):
+    elapsed = stats.elapsed()
+    route = route_path(scope)
+    metrics.request_duration.observe(elapsed, route, scope["method"], str(status))
+
+    duration = elapsed * 1000
+    reasons = over_budget(stats, duration)
+    if not reasons and not logger.isEnabledFor(logging.INFO):
+        return
+
+    record = {
+        "method": scope["method"],
+        "route": route,
+        "path": scope["path"],
+        "status": status,
+        "duration_ms": round(duration, 2),
+        "db_ms": round(stats.db_time * 1000, 2),
+        "queries": stats.queries,
+        "checkouts": stats.checkouts,
+    }
+    if reasons:
+        record["over_budget"] = reasons
+        logger.warning(json.dumps(record))
+    else:
+        logger.info(json.dumps(record))
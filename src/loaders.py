@@ -0,0 +1,198 @@
+import sqlalchemy as sa
+
+
+class Relation:
+    """
+    A query that resolves many keys at once. The statement selects the key it
+    was asked for as `key`, takes the keys as an :ids array, and returns
+    either one row per key (`many=False`) or any number of rows per key in the
+    order they should be listed. With `unique`, rows of the same key that
+    repeat that column are listed once.
+    """
+
+    def __init__(self, sql, many=True, unique=None):
+        self.statement = sa.text(sql)
+        self.many = many
+        self.unique = unique
+
+    def group(self, rows, keys):
+        """
+        Collects result rows into a dictionary keyed by the requested keys.
+        Runs in time linear in the number of rows.
+        """
+        if not self.many:
+            result = {key: None for key in keys}
+            for row in rows:
+                row = row._asdict()
+                result[row.pop("key")] = row
+            return result
+
+        # dictionaries keep insertion order, so keying each group on the unique
+        # column drops repeated rows without changing the listing order
+        groups = {key: {} for key in keys}
+        for i, row in enumerate(rows):
+            row = row._asdict()
+            group = groups[row.pop("key")]
+            group.setdefault(row[self.unique] if self.unique else i, row)
+
+        return {key: list(group.values()) for key, group in groups.items()}
+
+
+tracks = Relation(
+    """
+    SELECT t.track_id AS key, t.track_id, t.title, t.runtime, t.genre
+    FROM tracks AS t
+    WHERE t.track_id = ANY(:ids)
+    """,
+    many=False,
+)
+
+artists_by_track = Relation(
+    """
+    SELECT ta.track_id AS key, a.artist_id, a.name
+    FROM track_artist AS ta
+    JOIN artists AS a ON a.artist_id = ta.artist_id
+    WHERE ta.track_id = ANY(:ids)
+    ORDER BY ta.track_artist_id
+    """,
+    unique="artist_id",
+)
+
+# get_playlist lists every column of each artist
+artist_details_by_track = Relation(
+    """
+    SELECT ta.track_id AS key, a.artist_id, a.name, a.gender, a.deathdate,
+        a.birthdate
+    FROM track_artist AS ta
+    JOIN artists AS a ON a.artist_id = ta.artist_id
+    WHERE ta.track_id = ANY(:ids)
+    ORDER BY ta.track_artist_id
+    """,
+    unique="artist_id",
+)
+
+artists_by_album = Relation(
+    """
+    SELECT aa.album_id AS key, a.artist_id, a.name
+    FROM album_artist AS aa
+    JOIN artists AS a ON a.artist_id = aa.artist_id
+    WHERE aa.album_id = ANY(:ids)
+    ORDER BY aa.album_artist_id
+    """,
+    unique="artist_id",
+)
+
+tracks_by_album = Relation(
+    """
+    SELECT t.album_id AS key, t.track_id, t.title, t.runtime
+    FROM tracks AS t
+    WHERE t.album_id = ANY(:ids)
+    ORDER BY t.track_id
+    """,
+    unique="track_id",
+)
+
+tracks_by_artist = Relation(
+    """
+    SELECT ta.artist_id AS key, t.track_id, t.title, t.release_date
+    FROM track_artist AS ta
+    JOIN tracks AS t ON t.track_id = ta.track_id
+    WHERE ta.artist_id = ANY(:ids)
+    ORDER BY ta.track_artist_id
+    """,
+    unique="track_id",
+)
+
+albums_by_artist = Relation(
+    """
+    SELECT aa.artist_id AS key, a.album_id, a.title, a.release_date
+    FROM album_artist AS aa
+    JOIN albums AS a ON a.album_id = aa.album_id
+    WHERE aa.artist_id = ANY(:ids)
+    ORDER BY aa.album_artist_id
+    """,
+    unique="album_id",
+)
+
+tracks_by_playlist = Relation(
+    """
+    SELECT pt.playlist_id AS key, t.track_id, t.title, t.runtime, t.genre,
+        t.album_id, t.release_date, t.vibe_score
+    FROM playlist_track AS pt
+    JOIN tracks AS t ON t.track_id = pt.track_id
+    WHERE pt.playlist_id = ANY(:ids)
+    ORDER BY pt.playlist_track_id
+    """
+)
+
+
+class BatchLoader:
+    """
+    Resolves a relation for a batch of keys with a single query on `conn`.
+    Results are cached for the life of the loader, so asking again for a key
+    that was already loaded costs nothing.
+    """
+
+    def __init__(self, conn, relation):
+        self.conn = conn
+        self.relation = relation
+        self._cache = {}
+
+    def missing(self, keys):
+        return list(dict.fromkeys(key for key in keys if key not in self._cache))
+
+    def load_many(self, keys) -> dict:
+        keys = list(keys)
+        missing = self.missing(keys)
+        if missing:
+            rows = self.conn.execute(self.relation.statement, {"ids": missing})
+            self._cache.update(self.relation.group(rows, missing))
+
+        return {key: self._cache[key] for key in keys}
+
+    def load(self, key):
+        return self.load_many([key])[key]
+
+
+class AsyncBatchLoader(BatchLoader):
+    """
+    A batch loader on an AsyncConnection.
+    """
+
+    async def load_many(self, keys) -> dict:
+        keys = list(keys)
+        missing = self.missing(keys)
+        if missing:
+            rows = await self.conn.execute(self.relation.statement, {"ids": missing})
+            self._cache.update(self.relation.group(rows, missing))
+
+        return {key: self._cache[key] for key in keys}
+
+    async def load(self, key):
+        return (await self.load_many([key]))[key]
+
+
+class Loaders:
+    """
+    One batch loader per relation, sharing a connection. Create one per request.
+    """
+
+    loader = BatchLoader
+
+    def __init__(self, conn):
+        self.tracks = self.loader(conn, tracks)
+        self.artists_by_track = self.loader(conn, artists_by_track)
+        self.artist_details_by_track = self.loader(conn, artist_details_by_track)
+        self.artists_by_album = self.loader(conn, artists_by_album)
+        self.tracks_by_album = self.loader(conn, tracks_by_album)
+        self.tracks_by_artist = self.loader(conn, tracks_by_artist)
+        self.albums_by_artist = self.loader(conn, albums_by_artist)
+        self.tracks_by_playlist = self.loader(conn, tracks_by_playlist)
+
+
+class AsyncLoaders(Loaders):
+    """
+    Loaders on an AsyncConnection.
+    """
+
+    loader = AsyncBatchLoader
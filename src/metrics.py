@@ -0,0 +1,167 @@
+import bisect
+import threading
+
+# metrics in the order they are rendered
+registry = []
+
+# request and query latencies in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def label_text(names, values, extra="") -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    """
+    Base for metrics in the Prometheus text format. Values are kept per tuple
+    of label values, and every update takes one uncontended lock, so
+    recording stays cheap enough to leave on under load.
+    """
+
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def samples(self):
+        """
+        Yields (suffix, label values, extra label, value) for each sample.
+        """
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield "", key, "", value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self.samples():
+            labels = label_text(self.labels, key, extra)
+            lines.append(f"{self.name}{suffix}{labels} {value}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    """
+    Counts observations per bucket. The counts are made cumulative, as the
+    format expects, only when they are rendered.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                # one count per bucket, then +Inf, then the sum
+                counts = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[i] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(counts) for key, counts in self._values.items()}
+        for key, counts in sorted(values.items()):
+            total = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                total += count
+                yield "_bucket", key, f'le="{bound}"', total
+            yield "_sum", key, "", counts[-1]
+            yield "_count", key, "", total
+
+
+class Callback(Metric):
+    """
+    Metric whose values are read when it is rendered, from a function that
+    returns a dict of label values to value. Used for state that is already
+    tracked elsewhere, such as the connection pool.
+    """
+
+    def __init__(self, name, help, labels, read, kind="gauge"):
+        super().__init__(name, help, labels)
+        self.read = read
+        self.kind = kind
+
+    def samples(self):
+        for key, value in sorted(self.read().items()):
+            yield "", key, "", value
+
+
+def render() -> str:
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# *********************************************************************************
+# requests are recorded by src.instrumentation.TimingMiddleware
+request_duration = Histogram(
+    "http_request_duration_seconds",
+    "Time to handle a request, by route, method and status.",
+    ("route", "method", "status"),
+)
+requests_in_flight = Gauge(
+    "http_requests_in_flight", "Requests being handled.", ("method",)
+)
+
+# the connection pools, see src.database
+pool_wait = Histogram(
+    "db_pool_wait_seconds",
+    "Time to get a connection from the pool, including opening a new one.",
+    ("engine",),
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+
+# the weather provider, see src.weather
+weather_duration = Histogram(
+    "weather_request_duration_seconds",
+    "Time of calls to the weather provider, successful or not.",
+    ("client",),
+)
+weather_errors = Counter(
+    "weather_errors_total",
+    "Weather lookups that failed, by reason.",
+    ("client", "reason"),
+)
+
+# caches, by result: "hit", "stale" (served while it is refreshed) or "miss"
+cache_lookups = Counter(
+    "cache_lookups_total", "Cache lookups by cache and result.", ("cache", "result")
+)
@@ -0,0 +1,96 @@
+import base64
+import binascii
+import json
+from enum import Enum
+
+from fastapi import HTTPException
+
+
+class ListSort(str, Enum):
+    id = "id"
+    name = "name"
+    relevance = "relevance"
+
+
+def default_sort(sort, name):
+    """
+    Searches are ranked by relevance unless another order is asked for.
+    """
+    if sort is not None:
+        return sort
+    return ListSort.relevance if name else ListSort.id
+
+
+def encode_cursor(values) -> str:
+    """
+    Encodes the sort key of the last row on a page into an opaque cursor.
+    """
+    data = json.dumps(list(values), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def matches_type(value, type) -> bool:
+    # JSON has a single number type, and Python counts booleans as ints
+    if isinstance(value, bool):
+        return type is bool
+    if type is float:
+        return isinstance(value, (int, float))
+    return isinstance(value, type)
+
+
+def decode_cursor(cursor: str, types: list) -> list:
+    """
+    Decodes a cursor holding one value of each of the given types.
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(data)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        values = None
+
+    if (
+        not isinstance(values, list)
+        or len(values) != len(types)
+        or not all(map(matches_type, values, types))
+    ):
+        raise HTTPException(status_code=422, detail="Invalid cursor.")
+
+    return values
+
+
+def keyset(keys, cursor):
+    """
+    Returns the WHERE condition, ORDER BY list and bind parameters that page
+    through a query ordered by the `keys`, starting after `cursor`. Each key is
+    a SQL expression and the Python type of its values, and together the keys
+    must identify a row uniquely.
+
+    Seeking past the cursor with a row comparison lets each page start from an
+    index lookup, so deep pages cost the same as the first one. Postgres only
+    seeks on a row comparison whose columns all come from one index, and the
+    listings break ties on a joined table, so the first key is also compared
+    on its own to give the seek a bound on the base table.
+    """
+    expressions, types = zip(*keys)
+    order_by = ", ".join(expressions)
+    if not cursor:
+        return "TRUE", order_by, {}
+
+    values = decode_cursor(cursor, types)
+    names = [f"cursor_{i}" for i in range(len(keys))]
+    where = f"({order_by}) > ({', '.join(':' + name for name in names)})"
+    if len(keys) > 1:
+        where = f"{expressions[0]} >= :{names[0]} AND {where}"
+    return where, order_by, dict(zip(names, values))
+
+
+def next_cursor(rows, columns, limit):
+    """
+    Returns the cursor of the page after `rows`, or None if this is the last
+    page. `columns` are the result columns holding the sort keys.
+    """
+    if len(rows) < limit:
+        return None
+
+    last = rows[-1]._mapping
+    return encode_cursor(last[column] for column in columns)
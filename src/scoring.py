@@ -0,0 +1,122 @@
+import time
+from types import MappingProxyType
+
+import numpy as np
+from fastapi import HTTPException
+
+from src.vibe_index import RefreshingIndex
+
+# points added to the score for each mood
+MOODS = MappingProxyType(
+    {
+        "happy": 343,
+        "party": 286,
+        "workout": 229,
+        "focus": 171,
+        "chill": 114,
+        "sleep": 57,
+        "heartbroken": 0,
+    }
+)
+
+
+class WeatherRatings(RefreshingIndex):
+    """
+    Immutable in-memory copy of the weather table, mapping each weather
+    condition to its rating. It is read once and reloaded every `max_age`
+    seconds, or immediately with `refresh()`.
+    """
+
+    sql = """
+    SELECT weather, weather_rating
+    FROM weather
+    """
+
+    def __init__(self, max_age=3600):
+        super().__init__(max_age)
+        self._ratings = MappingProxyType({})
+
+    def load(self, rows):
+        ratings = MappingProxyType({row[0]: row[1] for row in rows})
+
+        with self._lock:
+            self._ratings = ratings
+            self._loaded_at = time.monotonic()
+
+    def get(self):
+        self.ensure_loaded()
+        return self._ratings
+
+
+weather_ratings = WeatherRatings()
+
+
+def get_weather_rating(ratings, weather):
+    try:
+        return ratings[weather]
+    except KeyError:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Unknown weather condition {weather}.",
+        )
+
+
+def get_mood_rating(mood):
+    try:
+        return MOODS[mood.lower()]
+    except KeyError:
+        raise HTTPException(
+            status_code=422,
+            detail="Invalid vibe.",
+        )
+
+
+def get_score(weather, time, temperature, mood, ratings=None):
+    """
+    Returns the vibe score for a weather condition, local time ("HH:MM"),
+    temperature in fahrenheit and mood.
+    """
+    ratings = weather_ratings.get() if ratings is None else ratings
+
+    score = 0
+
+    # TEMPERATURE
+    score += temperature * 4
+
+    # TIME OF DAY
+    hour = int(time.split(":")[0])
+    if hour >= 18 or hour <= 6:
+        score += 0
+    else:
+        score += 400
+
+    # WEATHER
+    score += get_weather_rating(ratings, weather)
+
+    # MOOD
+    score += get_mood_rating(mood)
+
+    return score / 4
+
+
+def score_many(conditions, ratings=None) -> np.ndarray:
+    """
+    Returns the vibe scores of many (weather, time, temperature, mood) tuples
+    at once, in the same order.
+    """
+    ratings = weather_ratings.get() if ratings is None else ratings
+
+    conditions = list(conditions)
+    if not conditions:
+        return np.empty(0)
+
+    weathers, times, temperatures, moods = zip(*conditions)
+
+    hours = np.array([int(t.split(":")[0]) for t in times])
+    temperatures = np.array(temperatures, dtype=float)
+    weather_scores = np.array([get_weather_rating(ratings, w) for w in weathers])
+    mood_scores = np.array([get_mood_rating(m) for m in moods])
+
+    daytime = (hours > 6) & (hours < 18)
+
+    return (temperatures * 4 + daytime * 400 + weather_scores + mood_scores) / 4
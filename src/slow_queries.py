@@ -0,0 +1,303 @@
+import functools
+import hashlib
+import json
+import logging
+import os
+import queue
+import re
+import statistics
+import threading
+import time
+from collections import deque
+
+import sqlalchemy as sa
+
+from src import database as db
+
+logger = logging.getLogger(__name__)
+
+# set to "true" to record the time of every statement by fingerprint
+ENABLED = os.environ.get("SLOW_QUERY_LOG", "false").lower() in ("1", "true")
+
+# statements slower than this many milliseconds are logged with their
+# parameters and plan
+THRESHOLD = float(os.environ.get("SLOW_QUERY_THRESHOLD_MS", 500))
+
+# fingerprints kept; when full, the one with the least total time is dropped
+MAX_FINGERPRINTS = int(os.environ.get("SLOW_QUERY_MAX_FINGERPRINTS", 500))
+
+# most recent timings kept per fingerprint for percentiles
+SAMPLES = 256
+
+# seconds a fingerprint's plan is reused before it is explained again
+EXPLAIN_TTL = 300
+
+# parameters whose name contains one of these are never logged
+REDACTED = ("password",)
+
+NORMALIZE = [
+    (re.compile(r"--[^\n]*"), " "),
+    (re.compile(r"/\*.*?\*/", re.DOTALL), " "),
+    # string literals, then bound parameters in any paramstyle, then numbers
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"%\(\w+\)s|%s|\$\d+|(?<![:\w]):\w+"), "?"),
+    (re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"\s+"), " "),
+    # IN lists and arrays of any length
+    (re.compile(r"([(\[]) ?\?(?: ?, ?\?)+ ?([)\]])"), r"\1?\2"),
+]
+
+
+@functools.lru_cache(maxsize=2048)
+def fingerprint(statement: str) -> tuple:
+    """
+    Returns (id, normalized statement), with literals and parameters replaced
+    by `?`, so that runs with different values are counted together.
+    """
+    normalized = statement
+    for pattern, replacement in NORMALIZE:
+        normalized = pattern.sub(replacement, normalized)
+    normalized = normalized.strip()
+    return hashlib.sha1(normalized.encode()).hexdigest()[:12], normalized
+
+
+def first_row(parameters):
+    """
+    Returns the parameters of a single execution, or of the first row of an
+    executemany.
+    """
+    if isinstance(parameters, list) and parameters:
+        if isinstance(parameters[0], (dict, list, tuple)):
+            return parameters[0]
+    return parameters
+
+
+def loggable(parameters):
+    """
+    Returns the parameters of a statement as JSON-friendly values, with
+    passwords left out.
+    """
+    parameters = first_row(parameters) or ()
+    if isinstance(parameters, dict):
+        return {
+            name: "<redacted>"
+            if any(word in name.lower() for word in REDACTED)
+            else str(value)[:200]
+            for name, value in parameters.items()
+        }
+    return [str(value)[:200] for value in parameters]
+
+
+def pyformat(statement, parameters):
+    """
+    Converts a statement with asyncpg's $1 placeholders to psycopg2's, so it
+    can be explained on the sync engine.
+    """
+    numbers = [int(n) for n in re.findall(r"\$(\d+)", statement)]
+    if not numbers:
+        return statement, ()
+    statement = re.sub(r"\$\d+", "%s", statement.replace("%", "%%"))
+    return statement, tuple(parameters[n - 1] for n in numbers)
+
+
+class Fingerprint:
+    __slots__ = ("id", "statement", "count", "total", "max", "rows", "times", "slowest")
+
+    def __init__(self, id, statement):
+        self.id = id
+        self.statement = statement
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.times = deque(maxlen=SAMPLES)
+        self.slowest = None
+
+    def add(self, elapsed, rows):
+        self.count += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        self.rows += rows
+        self.times.append(elapsed)
+
+    def summary(self) -> dict:
+        times = sorted(self.times)
+        return {
+            "fingerprint": self.id,
+            "statement": self.statement,
+            "count": self.count,
+            "total_ms": round(self.total * 1000, 2),
+            "mean_ms": round(self.total / self.count * 1000, 2),
+            "p50_ms": round(statistics.median(times) * 1000, 2),
+            "p95_ms": round(times[int(0.95 * (len(times) - 1))] * 1000, 2),
+            "max_ms": round(self.max * 1000, 2),
+            "rows": self.rows,
+            "slowest": self.slowest,
+        }
+
+
+class SlowQueryLog:
+    """
+    Records the time and rows of every statement run through SQLAlchemy,
+    aggregated by fingerprint in a table of at most `max_fingerprints`
+    entries.
+
+    Statements slower than `threshold` milliseconds are logged as warnings
+    with their parameters and EXPLAIN plan. The plan is fetched on a
+    connection of its own from a background thread, so the slow request does
+    not wait for it, and EXPLAIN is run without ANALYZE, so writes are not run
+    twice. Timings of statements read through server-side cursors, such as
+    the exports, only cover opening the cursor.
+    """
+
+    def __init__(self, threshold=THRESHOLD, max_fingerprints=MAX_FINGERPRINTS):
+        self.threshold = threshold / 1000
+        self.max_fingerprints = max_fingerprints
+        self._fingerprints = {}
+        self._plans = {}
+        self._lock = threading.Lock()
+        self._dumps = queue.Queue(maxsize=100)
+        self._worker = None
+
+    def events(self):
+        return (
+            ("before_cursor_execute", self.before_cursor_execute),
+            ("after_cursor_execute", self.after_cursor_execute),
+        )
+
+    def install(self):
+        """
+        Records the statements of every engine, including the async engine and
+        engines created later.
+        """
+        for name, fn in self.events():
+            if not sa.event.contains(sa.engine.Engine, name, fn):
+                sa.event.listen(sa.engine.Engine, name, fn)
+
+    def uninstall(self):
+        for name, fn in self.events():
+            if sa.event.contains(sa.engine.Engine, name, fn):
+                sa.event.remove(sa.engine.Engine, name, fn)
+
+    def before_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        context.slow_query_start = time.perf_counter()
+
+    def after_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        start = getattr(context, "slow_query_start", None)
+        if start is None or context.execution_options.get("slow_query_log") is False:
+            return
+
+        elapsed = time.perf_counter() - start
+        self.record(
+            statement,
+            parameters,
+            elapsed,
+            max(cursor.rowcount, 0),
+            conn.dialect.is_async,
+        )
+
+    def record(self, statement, parameters, elapsed, rows, is_async=False):
+        id, normalized = fingerprint(statement)
+        with self._lock:
+            entry = self._fingerprints.get(id)
+            if entry is None:
+                if len(self._fingerprints) >= self.max_fingerprints:
+                    cheapest = min(self._fingerprints.values(), key=lambda e: e.total)
+                    del self._fingerprints[cheapest.id]
+                entry = self._fingerprints[id] = Fingerprint(id, normalized)
+            entry.add(elapsed, rows)
+
+            slow = elapsed >= self.threshold
+            if slow and (entry.slowest is None or elapsed * 1000 > entry.slowest["ms"]):
+                entry.slowest = {
+                    "ms": round(elapsed * 1000, 2),
+                    "parameters": loggable(parameters),
+                }
+
+        if slow:
+            self.dump(id, statement, parameters, elapsed, is_async)
+
+    def dump(self, id, statement, parameters, elapsed, is_async):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self.write_dumps, daemon=True)
+                self._worker.start()
+        try:
+            self._dumps.put_nowait((id, statement, parameters, elapsed, is_async))
+        except queue.Full:
+            # the database is struggling already, don't queue more EXPLAINs
+            pass
+
+    def write_dumps(self):
+        while True:
+            id, statement, parameters, elapsed, is_async = self._dumps.get()
+            record = {
+                "fingerprint": id,
+                "ms": round(elapsed * 1000, 2),
+                "statement": statement,
+                "parameters": loggable(parameters),
+                "plan": self.plan(id, statement, parameters, is_async),
+            }
+            logger.warning(json.dumps(record, default=str))
+            self._dumps.task_done()
+
+    def plan(self, id, statement, parameters, is_async):
+        """
+        Returns the plan of a fingerprint, explaining it again at most every
+        EXPLAIN_TTL seconds.
+        """
+        cached = self._plans.get(id)
+        if cached is not None and time.monotonic() - cached[0] < EXPLAIN_TTL:
+            return cached[1]
+
+        parameters = first_row(parameters)
+        if is_async:
+            statement, parameters = pyformat(statement, parameters)
+
+        try:
+            with db.engine.connect() as conn:
+                conn = conn.execution_options(slow_query_log=False)
+                plan = conn.exec_driver_sql(
+                    f"EXPLAIN (FORMAT JSON) {statement}", parameters
+                ).scalar()
+        except sa.exc.SQLAlchemyError as e:
+            # statements such as COPY, SET or BEGIN can't be explained
+            plan = f"could not be explained: {e}"
+        if isinstance(plan, str) and plan.startswith("["):
+            plan = json.loads(plan)
+
+        self._plans[id] = (time.monotonic(), plan)
+        return plan
+
+    def summary(self, limit=50) -> list:
+        """
+        Returns the fingerprints that took the most total time first.
+        """
+        with self._lock:
+            entries = sorted(
+                self._fingerprints.values(), key=lambda e: e.total, reverse=True
+            )
+            summaries = [entry.summary() for entry in entries[:limit]]
+
+        for summary in summaries:
+            cached = self._plans.get(summary["fingerprint"])
+            summary["plan"] = cached[1] if cached else None
+        return summaries
+
+    def flush(self):
+        """
+        Waits until every queued slow statement is logged.
+        """
+        self._dumps.join()
+
+    def clear(self):
+        with self._lock:
+            self._fingerprints.clear()
+        self._plans.clear()
+
+
+log = SlowQueryLog()
@@ -0,0 +1,233 @@
+import bisect
+import threading
+import time
+from array import array
+
+import sqlalchemy as sa
+
+from src import database as db, metrics
+
+
+class RefreshingIndex:
+    """
+    Base for in-memory indexes built from the database.
+
+    Subclasses provide `sql` and `load(rows)`. The index is loaded lazily on
+    first use and fully reloaded once it is older than `max_age` seconds, which
+    picks up rows written through other workers.
+    """
+
+    sql = None
+
+    def __init__(self, max_age=300):
+        self.max_age = max_age
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def refresh(self):
+        """
+        Reload the index from the database.
+        """
+        with db.engine.begin() as conn:
+            rows = conn.execute(sa.text(self.sql)).fetchall()
+
+        self.load(rows)
+
+    def is_stale(self):
+        return (
+            self._loaded_at is None or time.monotonic() - self._loaded_at > self.max_age
+        )
+
+    def ensure_loaded(self):
+        if not self.is_stale():
+            metrics.cache_lookups.inc(type(self).__name__, "hit")
+            return
+
+        metrics.cache_lookups.inc(type(self).__name__, "miss")
+
+        # only one thread reloads, the others wait for it and reuse the result
+        with self._refresh_lock:
+            if self.is_stale():
+                self.refresh()
+
+
+class VibeIndex(RefreshingIndex):
+    """
+    In-memory index of every track ordered by vibe score.
+
+    Scores and track ids are kept in two parallel arrays sorted by score, so a
+    nearest-k lookup is a binary search followed by a two-pointer walk outward
+    from the insertion point: O(log n + k) instead of sorting the catalog.
+    Tracks added through this process are inserted immediately with `add`.
+    """
+
+    sql = """
+    SELECT track_id, vibe_score
+    FROM tracks
+    """
+
+    def __init__(self, max_age=300):
+        super().__init__(max_age)
+        self._scores = array("i")
+        self._track_ids = array("i")
+
+    def __len__(self):
+        return len(self._scores)
+
+    def load(self, rows):
+        """
+        Replace the contents of the index with (track_id, vibe_score) rows.
+        """
+        rows = sorted(rows, key=lambda row: (row[1], row[0]))
+        scores = array("i", (row[1] for row in rows))
+        track_ids = array("i", (row[0] for row in rows))
+
+        with self._lock:
+            self._scores = scores
+            self._track_ids = track_ids
+            self._loaded_at = time.monotonic()
+
+    def add(self, track_id, vibe_score):
+        """
+        Insert a newly created track. Does nothing if the index has not been
+        loaded yet, since the first load will read the track from the database.
+        """
+        with self._lock:
+            if self._loaded_at is None:
+                return
+
+            i = bisect.bisect_right(self._scores, vibe_score)
+            self._scores.insert(i, vibe_score)
+            self._track_ids.insert(i, track_id)
+
+    def nearest(self, score, k):
+        """
+        Return the ids of the k tracks whose vibe score is closest to `score`,
+        closest first. Ties are broken in favour of the lower vibe score.
+        """
+        self.ensure_loaded()
+
+        with self._lock:
+            scores = self._scores
+            track_ids = self._track_ids
+
+            hi = bisect.bisect_left(scores, score)
+            lo = hi - 1
+            result = []
+            while len(result) < k and (lo >= 0 or hi < len(scores)):
+                if hi >= len(scores) or (
+                    lo >= 0 and score - scores[lo] <= scores[hi] - score
+                ):
+                    result.append(track_ids[lo])
+                    lo -= 1
+                else:
+                    result.append(track_ids[hi])
+                    hi += 1
+
+        return result
+
+
+class AlbumStats(RefreshingIndex):
+    """
+    In-memory average vibe score and track count of every album.
+
+    Albums are kept in a list of (average, track_count, album_id) tuples, so the
+    album closest to a score is found by binary search on the average, and among
+    albums with that average the one closest to a track count by a second
+    binary search on the count.
+    """
+
+    sql = """
+    SELECT album_id, SUM(vibe_score), COUNT(*)
+    FROM tracks
+    WHERE album_id IS NOT NULL
+    GROUP BY album_id
+    """
+
+    def __init__(self, max_age=300):
+        super().__init__(max_age)
+        self._totals = {}
+        self._order = []
+
+    def __len__(self):
+        return len(self._order)
+
+    def load(self, rows):
+        """
+        Replace the contents of the index with (album_id, vibe_sum, track_count)
+        rows.
+        """
+        totals = {row[0]: (row[1], row[2]) for row in rows}
+        order = sorted(
+            (vibe_sum / count, count, album_id)
+            for album_id, (vibe_sum, count) in totals.items()
+        )
+
+        with self._lock:
+            self._totals = totals
+            self._order = order
+            self._loaded_at = time.monotonic()
+
+    def add(self, album_id, vibe_score):
+        """
+        Account for a newly created track on an album. Does nothing if the index
+        has not been loaded yet.
+        """
+        with self._lock:
+            if self._loaded_at is None:
+                return
+
+            vibe_sum, count = self._totals.get(album_id, (0, 0))
+            if count:
+                entry = (vibe_sum / count, count, album_id)
+                del self._order[bisect.bisect_left(self._order, entry)]
+
+            vibe_sum, count = vibe_sum + vibe_score, count + 1
+            self._totals[album_id] = (vibe_sum, count)
+            bisect.insort(self._order, (vibe_sum / count, count, album_id))
+
+    def nearest(self, score, num_tracks):
+        """
+        Return the id of the album whose average vibe score is closest to
+        `score`, breaking ties by the track count closest to `num_tracks`.
+        Returns None if there are no albums.
+        """
+        self.ensure_loaded()
+
+        with self._lock:
+            order = self._order
+            if not order:
+                return None
+
+            # averages on either side of the score
+            i = bisect.bisect_left(order, (score,))
+            averages = [order[j][0] for j in (i - 1, i) if 0 <= j < len(order)]
+            distance = min(abs(average - score) for average in averages)
+
+            candidates = []
+            for average in averages:
+                if abs(average - score) != distance:
+                    continue
+
+                # albums sharing this average are sorted by track count
+                lo = bisect.bisect_left(order, (average,))
+                hi = bisect.bisect_left(order, (average, float("inf")))
+                j = bisect.bisect_left(order, (average, num_tracks), lo, hi)
+                if j < hi:
+                    candidates.append(order[j])
+                if j > lo:
+                    count = order[j - 1][1]
+                    candidates.append(
+                        order[bisect.bisect_left(order, (average, count), lo, hi)]
+                    )
+
+        best = min(
+            candidates,
+            key=lambda entry: (abs(entry[1] - num_tracks), entry[2]),
+        )
+        return best[2]
+
+
+track_index = VibeIndex()
+album_stats = AlbumStats()
@@ -1,6 +1,17 @@
+import asyncio
+import json
 import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
 import dotenv
+import httpx
 import requests
+import sqlalchemy as sa
+
+from src import database as db, metrics
 
 
 def get_api_key() -> str:
@@ -9,19 +20,467 @@ def get_api_key() -> str:
     return API_KEY
 
 
+# *********************************************************************************
+# configuration
+
+API_URL = os.environ.get("WEATHER_API_URL", "http://api.weatherapi.com/v1")
+
+# seconds to wait for a connection and for the response once connected
+CONNECT_TIMEOUT = float(os.environ.get("WEATHER_CONNECT_TIMEOUT", 1.0))
+READ_TIMEOUT = float(os.environ.get("WEATHER_READ_TIMEOUT", 2.0))
+
+# weather changes over minutes, so a reading is reused for this many seconds
+CACHE_TTL = int(os.environ.get("WEATHER_CACHE_TTL", 300))
+
+# after that, the last known reading is still served for this many seconds
+# while it is refreshed in the background or the provider is down
+STALE_TTL = int(os.environ.get("WEATHER_STALE_TTL", 3600))
+
+# unknown locations are cached for a shorter time so typos don't hit the provider
+ERROR_TTL = int(os.environ.get("WEATHER_ERROR_TTL", 60))
+
+# set to share readings between workers through the weather_cache table
+SHARED_CACHE = os.environ.get("WEATHER_SHARED_CACHE", "").lower() in ("1", "true")
+
+LAT_LONG = re.compile(r"^(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)$")
+
+
+class WeatherUnavailable(Exception):
+    """
+    Raised when the provider cannot be reached and there is no reading to fall
+    back on.
+    """
+
+
+def normalize_location(location: str) -> str:
+    """
+    Normalizes a location so that equivalent spellings share a cache entry.
+    Names are lowercased with whitespace collapsed, lat,long pairs are rounded
+    to two decimal places (about a kilometer).
+    """
+    location = " ".join(location.split()).lower()
+
+    match = LAT_LONG.match(location)
+    if match:
+        lat, long = (round(float(x), 2) for x in match.groups())
+        return f"{lat:.2f},{long:.2f}"
+
+    return location
+
+
+# *********************************************************************************
+# caching
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries are fresh for a time to live, then kept
+    as stale for `stale_ttl` more seconds before they are dropped. Entries set
+    with `stale=False` are dropped as soon as they expire.
+    """
+
+    def __init__(self, maxsize=1024, ttl=CACHE_TTL, stale_ttl=0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_entry(self, key):
+        """
+        Returns (value, is_fresh), or None if there is no usable entry.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            fresh_until, stale_until, value = entry
+            now = time.monotonic()
+            if stale_until < now:
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value, fresh_until >= now
+
+    def get(self, key):
+        entry = self.get_entry(key)
+        if entry is None or not entry[1]:
+            return None
+        return entry[0]
+
+    def set(self, key, value, ttl=None, stale=True):
+        fresh_until = time.monotonic() + (self.ttl if ttl is None else ttl)
+        stale_until = fresh_until + (self.stale_ttl if stale else 0)
+        with self._lock:
+            self._entries[key] = (fresh_until, stale_until, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls for the same key into one: the first caller runs
+    the function, the others wait for it and share its result.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def in_flight(self, key):
+        return key in self._calls
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+
+class CircuitBreaker:
+    """
+    Fails fast while the provider is unhealthy. After `threshold` consecutive
+    failures the circuit opens and calls are refused; once `reset_timeout`
+    seconds have passed a single trial call is let through, and its outcome
+    closes the circuit again or keeps it open.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+
+            if (
+                not self._trial
+                and time.monotonic() - self._opened_at >= self.reset_timeout
+            ):
+                self._trial = True
+                return True
+
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial = False
+            if self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+
+
+def get_shared(key) -> dict:
+    sql = """
+    SELECT data
+    FROM weather_cache
+    WHERE location_key = :key AND fetched_at > now() - make_interval(secs => :ttl)
+    """
+    try:
+        with db.engine.begin() as conn:
+            return conn.execute(sa.text(sql), {"key": key, "ttl": CACHE_TTL}).scalar()
+    except sa.exc.SQLAlchemyError:
+        # the shared tier is only an optimization, fall through to the provider
+        return None
+
+
+def set_shared(key, data):
+    sql = """
+    INSERT INTO weather_cache (location_key, data, fetched_at)
+    VALUES (:key, CAST(:data AS JSONB), now())
+    ON CONFLICT (location_key)
+    DO UPDATE SET data = EXCLUDED.data, fetched_at = EXCLUDED.fetched_at
+    """
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(sa.text(sql), {"key": key, "data": json.dumps(data)})
+    except sa.exc.SQLAlchemyError:
+        pass
+
+
+# *********************************************************************************
+# provider
+
+
+def parse_weather(status_code, result) -> dict:
+    if status_code >= 500:
+        raise WeatherUnavailable(f"Weather provider returned {status_code}.")
+
+    try:
+        if "error" in result:
+            return {"error": result["error"]["message"]}
+
+        data = {
+            "location": result["location"]["name"],
+            "temperature": result["current"]["temp_f"],
+            "wind_speed": result["current"]["wind_mph"],
+            "weather": result["current"]["condition"]["text"],
+            "time": result["location"]["localtime"][11:],
+        }
+    except (KeyError, TypeError, IndexError) as e:
+        raise WeatherUnavailable(
+            "Weather provider returned an unexpected response."
+        ) from e
+    return data
+
+
+def record_lookup(entry):
+    if entry is None:
+        metrics.cache_lookups.inc("weather", "miss")
+    else:
+        metrics.cache_lookups.inc("weather", "hit" if entry[1] else "stale")
+
+
+class WeatherClient:
+    """
+    Weather provider client shared by the sync and async code paths.
+
+    Both paths use persistent keep-alive connections with strict timeouts, go
+    through the same circuit breaker, and share one cache: readings are served
+    from memory, then from the shared weather_cache table if enabled, and only
+    then from the provider, with one provider call per location at a time.
+    Stale readings are served while they are refreshed in the background.
+    """
+
+    def __init__(
+        self,
+        base_url=API_URL,
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=READ_TIMEOUT,
+        cache=None,
+        breaker=None,
+        shared_cache=SHARED_CACHE,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.cache = cache or TTLCache(stale_ttl=STALE_TTL)
+        self.breaker = breaker or CircuitBreaker()
+        self.shared_cache = shared_cache
+
+        self._session = requests.Session()
+        self._flight = SingleFlight()
+
+        self._async_client = None
+        self._loop = None
+        self._tasks = {}
+
+    def remember(self, key, data):
+        if "error" in data:
+            # an answer such as "location not found" is not served once expired
+            self.cache.set(key, data, ERROR_TTL, stale=False)
+        else:
+            self.cache.set(key, data)
+
+    # sync *************************************************************************
+
+    def fetch(self, location) -> dict:
+        if not self.breaker.allow():
+            metrics.weather_errors.inc("sync", "circuit_open")
+            raise WeatherUnavailable("Weather provider is unavailable.")
+
+        start = time.perf_counter()
+        try:
+            result = self._session.get(
+                f"{self.base_url}/current.json",
+                params={"key": get_api_key(), "q": location},
+                timeout=(self.connect_timeout, self.read_timeout),
+            )
+            data = parse_weather(result.status_code, result.json())
+        except (requests.RequestException, ValueError, WeatherUnavailable) as e:
+            self.breaker.record_failure()
+            reason = "timeout" if isinstance(e, requests.Timeout) else "failed"
+            metrics.weather_errors.inc("sync", reason)
+            raise WeatherUnavailable("Weather provider is unavailable.") from e
+        finally:
+            metrics.weather_duration.observe(time.perf_counter() - start, "sync")
+
+        self.breaker.record_success()
+        return data
+
+    def load(self, key) -> dict:
+        # another caller may have filled the cache while we waited our turn
+        data = self.cache.get(key)
+        if data is not None:
+            return data
+
+        if self.shared_cache:
+            data = get_shared(key)
+            if data is not None:
+                self.cache.set(key, data)
+                return data
+
+        data = self.fetch(key)
+        self.remember(key, data)
+        if self.shared_cache and "error" not in data:
+            set_shared(key, data)
+        return data
+
+    def refresh_quietly(self, key):
+        try:
+            self._flight.do(key, lambda: self.load(key))
+        except WeatherUnavailable:
+            pass
+
+    def get(self, city) -> dict:
+        key = normalize_location(city)
+
+        entry = self.cache.get_entry(key)
+        record_lookup(entry)
+        if entry is not None:
+            data, fresh = entry
+            if not fresh and not self._flight.in_flight(key):
+                threading.Thread(
+                    target=self.refresh_quietly, args=(key,), daemon=True
+                ).start()
+            return data
+
+        return self._flight.do(key, lambda: self.load(key))
+
+    # async ************************************************************************
+
+    def async_client(self) -> httpx.AsyncClient:
+        # a client is bound to the event loop it was created on
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._loop is not loop:
+            if self._async_client is not None:
+                db.close_on_loop(self._loop, self._async_client.aclose)
+            self._async_client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+            )
+            self._loop = loop
+            self._tasks = {}
+        return self._async_client
+
+    async def fetch_async(self, location) -> dict:
+        if not self.breaker.allow():
+            metrics.weather_errors.inc("async", "circuit_open")
+            raise WeatherUnavailable("Weather provider is unavailable.")
+
+        start = time.perf_counter()
+        try:
+            result = await self.async_client().get(
+                "/current.json", params={"key": get_api_key(), "q": location}
+            )
+            data = parse_weather(result.status_code, result.json())
+        except (httpx.HTTPError, ValueError, WeatherUnavailable) as e:
+            self.breaker.record_failure()
+            reason = "timeout" if isinstance(e, httpx.TimeoutException) else "failed"
+            metrics.weather_errors.inc("async", reason)
+            raise WeatherUnavailable("Weather provider is unavailable.") from e
+        finally:
+            metrics.weather_duration.observe(time.perf_counter() - start, "async")
+
+        self.breaker.record_success()
+        return data
+
+    async def load_async(self, key) -> dict:
+        if self.shared_cache:
+            data = await asyncio.to_thread(get_shared, key)
+            if data is not None:
+                self.cache.set(key, data)
+                return data
+
+        data = await self.fetch_async(key)
+        self.remember(key, data)
+        if self.shared_cache and "error" not in data:
+            await asyncio.to_thread(set_shared, key, data)
+        return data
+
+    def load_task(self, key) -> asyncio.Task:
+        self.async_client()
+
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.create_task(self.load_async(key))
+            self._tasks[key] = task
+            task.add_done_callback(lambda t: self._tasks.pop(key, None))
+        return task
+
+    async def get_async(self, city) -> dict:
+        key = normalize_location(city)
+
+        entry = self.cache.get_entry(key)
+        record_lookup(entry)
+        if entry is not None:
+            data, fresh = entry
+            if not fresh:
+                task = self.load_task(key)
+                # nobody awaits a background refresh, so retrieve its exception
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            return data
+
+        # shield the shared load so one caller disconnecting doesn't cancel it
+        return await asyncio.shield(self.load_task(key))
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+
+client = WeatherClient()
+
+
 def get_weather_data(city) -> dict:
-    result = requests.get(
-        f"http://api.weatherapi.com/v1/current.json?key={get_api_key()}&q={city}"
-    )
-
-    if "error" in result.json():
-        return {"error": result.json()["error"]["message"]}
-
-    json = {
-        "location": result.json()["location"]["name"],
-        "temperature": result.json()["current"]["temp_f"],
-        "wind_speed": result.json()["current"]["wind_mph"],
-        "weather": result.json()["current"]["condition"]["text"],
-        "time": result.json()["location"]["localtime"][11:],
-    }
-    return json
+    """
+    Returns the current weather for a location, raising WeatherUnavailable if
+    the provider cannot be reached and there is no reading to fall back on.
+    """
+    return client.get(city)
+
+
+async def get_weather_data_async(city) -> dict:
+    """
+    Async version of get_weather_data.
+    """
+    return await client.get_async(city)
@@ -0,0 +1,312 @@
+"""
+Query plan regression check.
+
+    python -m testing.query_plans            # compare with testing/query_plans.json
+    python -m testing.query_plans --update   # record a new baseline
+
+The baseline is recorded against a database seeded with `python
+autopopulate.py` at the default scale and seed, which always generates the
+same data.
+
+Calls every endpoint once against the local, seeded database (the weather
+comes from the stub in testing/weather_stub.py) and records each distinct
+statement the routers run, with the parameters of its first use. Every
+statement is then run again under EXPLAIN (ANALYZE, BUFFERS) in a
+transaction that is rolled back, and its plan shape, estimated cost and
+buffer use are compared with the baseline. Writes that conflict with what
+later requests did to their rows are only planned, without ANALYZE.
+
+A statement fails the check when a table it used to read through an index is
+now scanned sequentially, when its estimated cost exceeds the `budget` in the
+baseline (twice the recorded cost, edit it by hand to tighten it), or when it
+is new and not in the baseline yet. Rows written with COPY by the bulk
+endpoints do not go through SQLAlchemy and are not checked.
+"""
+import argparse
+import json
+import os
+import uuid
+
+import sqlalchemy as sa
+from fastapi.testclient import TestClient
+
+from src import database as db, weather
+from src.api.server import app
+from src.explain import explain, seq_scans, shape
+from testing.weather_stub import StubWeatherServer
+
+BASELINE = os.path.join(os.path.dirname(__file__), "query_plans.json")
+BUDGET_FACTOR = 2.0
+
+
+def statement_key(statement) -> str:
+    return " ".join(str(statement).split())
+
+
+class Recorder:
+    """
+    Engine event listener that keeps the first use of each statement, with
+    its parameters and the request that ran it.
+    """
+
+    def __init__(self):
+        self.statements = {}
+        self.request = None
+
+    def __call__(self, conn, clauseelement, multiparams, params, execution_options):
+        if not isinstance(clauseelement, sa.sql.ClauseElement):
+            return
+
+        key = statement_key(clauseelement)
+        if key not in self.statements:
+            bound = multiparams[0] if multiparams else params
+            self.statements[key] = (self.request, clauseelement, dict(bound or {}))
+
+
+def database_reachable() -> bool:
+    try:
+        with db.engine.connect():
+            return True
+    except (sa.exc.SQLAlchemyError, ValueError):
+        # ValueError when the connection settings are missing
+        return False
+
+
+def sample_ids():
+    with db.engine.connect() as conn:
+        return conn.execute(
+            sa.text(
+                """
+                SELECT
+                    (SELECT min(track_id) FROM tracks) AS track_id,
+                    (SELECT min(album_id) FROM albums) AS album_id,
+                    (SELECT min(artist_id) FROM artists) AS artist_id,
+                    (SELECT min(user_id) FROM users) AS user_id,
+                    (SELECT playlist_id FROM playlist_track
+                     ORDER BY playlist_track_id LIMIT 1) AS playlist_id
+                """
+            )
+        ).one()
+
+
+def call_endpoints(client, recorder):
+    """
+    Calls every endpoint, including the second page of each listing, and
+    returns the requests that failed.
+    """
+    ids = sample_ids()
+    failures = []
+
+    def call(route, method, path, **kwargs):
+        recorder.request = route
+        response = client.request(method, path, **kwargs)
+        if response.status_code >= 400:
+            failures.append(f"{method} {path}: {response.status_code} {response.text}")
+        return response
+
+    for name in ("tracks", "albums", "artists"):
+        route = f"GET /{name}/"
+        first = call(route, "GET", f"/{name}/?limit=10")
+        cursor = first.headers.get("X-Next-Cursor")
+        if cursor:
+            call(route, "GET", f"/{name}/?limit=10&cursor={cursor}")
+        call(route, "GET", f"/{name}/?limit=10&name=the")
+        call(route, "GET", f"/{name}/?limit=10&sort=name")
+        call(f"GET /export/{name}", "GET", f"/export/{name}")
+
+    call("GET /tracks/{track_id}", "GET", f"/tracks/{ids.track_id}")
+    call("GET /albums/{album_id}", "GET", f"/albums/{ids.album_id}")
+    call("GET /artists/{artist_id}", "GET", f"/artists/{ids.artist_id}")
+    call("GET /playlists/{playlist_id}", "GET", f"/playlists/{ids.playlist_id}")
+    call("GET /search/autocomplete", "GET", "/search/autocomplete?q=the")
+    call("GET /playlists/generate/", "GET", "/playlists/generate/?location=Plan+Check")
+    call("GET /albums/recommend/", "GET", "/albums/recommend/?location=Plan+Check")
+
+    user = {"username": f"plan-check-{uuid.uuid4().hex[:8]}", "password": "plan-check"}
+    call("POST /users/", "POST", "/users/", json=user)
+    call("POST /users/validate/", "POST", "/users/validate/", json=user)
+
+    track = {
+        "title": "plan check",
+        "album_id": ids.album_id,
+        "runtime": 200,
+        "genre": "rock",
+        "release_date": "2020-01-01",
+        "artist_ids": [ids.artist_id],
+        "vibe_score": 200,
+    }
+    call("POST /tracks/", "POST", "/tracks/", json=track)
+    call("POST /tracks/bulk", "POST", "/tracks/bulk", json=[track])
+
+    playlist = {
+        "name": "plan check",
+        "track_ids": [ids.track_id],
+        "user_id": ids.user_id,
+    }
+    playlist_id = call("POST /playlists/", "POST", "/playlists/", json=playlist).json()
+    path = f"/playlists/{playlist_id}"
+    call(
+        "PATCH /playlists/{playlist_id}/tracks",
+        "PATCH",
+        f"{path}/tracks",
+        json={"add": [ids.track_id], "remove": [ids.track_id]},
+    )
+    call(
+        "PUT /playlists/{playlist_id}/track/{track_id}",
+        "PUT",
+        f"{path}/track/{ids.track_id}",
+    )
+    call(
+        "DELETE /playlists/{playlist_id}/tracks/{track_id}",
+        "DELETE",
+        f"{path}/tracks/{ids.track_id}",
+    )
+    call("DELETE /playlists/{playlist_id}", "DELETE", path)
+
+    return failures
+
+
+def explain_rolled_back(conn, statement, params, analyze=False) -> dict:
+    with conn.begin() as transaction:
+        try:
+            return explain(conn, statement, params, analyze=analyze)
+        finally:
+            transaction.rollback()
+
+
+def measure(statements) -> dict:
+    """
+    Runs each recorded statement under EXPLAIN ANALYZE and summarizes its plan.
+    """
+    results = {}
+    with db.engine.connect() as conn:
+        for key, (request, statement, params) in statements.items():
+            try:
+                try:
+                    plan = explain_rolled_back(conn, statement, params, analyze=True)
+                except sa.exc.IntegrityError:
+                    # a write whose rows later requests changed, such as an
+                    # insert into a playlist that was deleted since, can still
+                    # be planned
+                    plan = explain_rolled_back(conn, statement, params)
+            except sa.exc.DBAPIError as e:
+                results[key] = {"request": request, "error": str(e.orig)}
+                continue
+
+            results[key] = {
+                "request": request,
+                "shape": shape(plan),
+                "seq_scans": sorted(set(seq_scans(plan))),
+                "cost": plan["Total Cost"],
+                "shared_hit": plan.get("Shared Hit Blocks", 0),
+                "shared_read": plan.get("Shared Read Blocks", 0),
+            }
+    return results
+
+
+def run() -> tuple:
+    """
+    Records and measures every statement. Returns the plan summaries keyed
+    by statement and the requests that failed.
+    """
+    stub = StubWeatherServer()
+    stub.start()
+    weather_client = weather.client
+    weather.client = weather.WeatherClient(base_url=stub.url)
+
+    recorder = Recorder()
+    sa.event.listen(sa.engine.Engine, "before_execute", recorder)
+    try:
+        failures = call_endpoints(TestClient(app), recorder)
+    finally:
+        sa.event.remove(sa.engine.Engine, "before_execute", recorder)
+        weather.client = weather_client
+        stub.stop()
+
+    return measure(recorder.statements), failures
+
+
+def compare(baseline, current) -> tuple:
+    """
+    Returns the regressions, and notes on plans that changed without getting
+    worse.
+    """
+    problems = []
+    notes = []
+    for key, plan in current.items():
+        name = f"{plan['request']}: {key[:120]}"
+        if "error" in plan:
+            problems.append(f"{name}\n    could not be explained: {plan['error']}")
+            continue
+
+        expected = baseline.get(key)
+        if expected is None:
+            problems.append(f"{name}\n    is not in the baseline, run with --update")
+            continue
+
+        new_scans = set(plan["seq_scans"]) - set(expected["seq_scans"])
+        if new_scans:
+            problems.append(
+                f"{name}\n    now scans {', '.join(sorted(new_scans))} sequentially"
+            )
+        if plan["cost"] > expected["budget"]:
+            problems.append(
+                f"{name}\n    costs {plan['cost']}, over its budget of "
+                f"{expected['budget']}"
+            )
+        if plan["shape"] != expected["shape"] and not new_scans:
+            lines = "\n      ".join(plan["shape"])
+            notes.append(f"{name}\n    plan changed:\n      {lines}")
+
+    for key in baseline.keys() - current.keys():
+        notes.append(f"{baseline[key]['request']}: {key[:120]}\n    was not run")
+
+    return problems, notes
+
+
+def load_baseline() -> dict:
+    with open(BASELINE) as f:
+        return json.load(f)
+
+
+def save_baseline(current, previous):
+    baseline = {}
+    for key, plan in sorted(current.items()):
+        if "error" in plan:
+            continue
+        # keep budgets that were set by hand
+        budget = previous.get(key, {}).get("budget")
+        budget = budget or round(plan["cost"] * BUDGET_FACTOR, 2)
+        baseline[key] = {**plan, "budget": budget}
+
+    with open(BASELINE, "w") as f:
+        json.dump(baseline, f, indent=2)
+        f.write("\n")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--update", action="store_true", help="record a new baseline")
+    args = parser.parse_args()
+
+    current, failures = run()
+    for failure in failures:
+        print(f"request failed: {failure}")
+
+    previous = load_baseline() if os.path.exists(BASELINE) else {}
+    if args.update:
+        save_baseline(current, previous)
+        print(f"recorded {len(current)} statements in {BASELINE}")
+        return
+
+    problems, notes = compare(previous, current)
+    for note in notes:
+        print(note)
+    for problem in problems:
+        print(f"REGRESSION {problem}")
+    print(f"{len(current)} statements, {len(problems)} regressions")
+    raise SystemExit(1 if problems or failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -31,3 +31,9 @@ def test_get_album_fail():
 def test_get_album_fail2():
     response = client.get("/albums/-1")
     assert response.status_code == 404
+
+
+def test_recommend_bad_mood():
+    response = client.get("/albums/recommend/?mood=grumpy")
+    assert response.status_code == 422
+    assert response.json()["detail"] == "Invalid vibe."
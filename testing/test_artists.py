@@ -1,6 +1,7 @@
 from fastapi.testclient import TestClient
 
 from src.api.server import app
+from src.pagination import encode_cursor
 
 import json
 
@@ -23,3 +24,14 @@ def test_get_artist2_404():
     # unprocessable entity
     response = client.get("/artists/af")
     assert response.status_code == 422
+
+
+def test_list_artists_bad_cursor():
+    response = client.get("/artists?cursor=badtest")
+    assert response.status_code == 422
+
+
+def test_list_artists_cursor_with_wrong_types():
+    cursor = encode_cursor(["x", "y"])
+    response = client.get(f"/artists?sort=name&cursor={cursor}")
+    assert response.status_code == 422
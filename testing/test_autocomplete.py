@@ -0,0 +1,55 @@
+from src.autocomplete import PrefixIndex
+
+
+def make_index():
+    index = PrefixIndex()
+    index.load(
+        [
+            (0, 1, "The Beatles"),
+            (0, 2, "Beach House"),
+            (1, 1, "Abbey Road"),
+            (2, 1, "beat it"),
+            (2, 2, "Road to Nowhere"),
+        ]
+    )
+    return index
+
+
+def test_complete_prefix():
+    index = make_index()
+    assert [r["name"] for r in index.complete("bea")] == [
+        "Beach House",
+        "beat it",
+        "The Beatles",
+    ]
+
+
+def test_complete_word_and_limit():
+    index = make_index()
+    results = index.complete("ROAD", 1)
+    assert results == [{"type": "track", "id": 2, "name": "Road to Nowhere"}]
+
+
+def test_complete_ranks_leading_matches_first():
+    index = make_index()
+    assert [r["name"] for r in index.complete("road")] == [
+        "Road to Nowhere",
+        "Abbey Road",
+    ]
+
+
+def test_complete_no_match():
+    index = make_index()
+    assert index.complete("zeppelin") == []
+
+
+def test_add():
+    index = make_index()
+    index.add("track", 3, "beast of burden")
+    assert [r["id"] for r in index.complete("beas")] == [3]
+    assert len(index.complete("bea", 10)) == 4
+    index.add("album", 2, "Best of the Beasts")
+    assert [r["name"] for r in index.complete("beas")] == [
+        "beast of burden",
+        "Best of the Beasts",
+    ]
@@ -0,0 +1,20 @@
+import datetime
+
+from src.bulk import text_value
+
+
+def test_text_value_null():
+    assert text_value(None) == "\\N"
+
+
+def test_text_value_empty_string_is_not_null():
+    assert text_value("") == ""
+
+
+def test_text_value_escapes_special_characters():
+    assert text_value("a\tb\nc\\d\r") == "a\\tb\\nc\\\\d\\r"
+
+
+def test_text_value_dates_and_numbers():
+    assert text_value(datetime.date(2020, 1, 2)) == "2020-01-02"
+    assert text_value(42) == "42"
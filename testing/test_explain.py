@@ -0,0 +1,57 @@
+import pytest
+
+from src import database as db, loaders
+from src.explain import seq_scans, unindexed_tables
+
+# the queries behind get_playlist, get_album, get_artist, get_track and the
+# playlist deletes, with the tables they join through
+JOIN_PATHS = {
+    "tracks of a playlist": (loaders.tracks_by_playlist.statement, {"ids": [1]}),
+    "artists of tracks": (loaders.artists_by_track.statement, {"ids": [1, 2]}),
+    "artist details of tracks": (
+        loaders.artist_details_by_track.statement,
+        {"ids": [1, 2]},
+    ),
+    "artists of an album": (loaders.artists_by_album.statement, {"ids": [1]}),
+    "tracks of an album": (loaders.tracks_by_album.statement, {"ids": [1]}),
+    "tracks of an artist": (loaders.tracks_by_artist.statement, {"ids": [1]}),
+    "albums of an artist": (loaders.albums_by_artist.statement, {"ids": [1]}),
+    "tracks by id": (loaders.tracks.statement, {"ids": [1, 2]}),
+    "remove tracks from a playlist": (
+        """
+        DELETE FROM playlist_track
+        WHERE playlist_id = :playlist_id AND track_id = ANY(:track_ids)
+        """,
+        {"playlist_id": 1, "track_ids": [1, 2]},
+    ),
+    "delete a playlist's tracks": (
+        "DELETE FROM playlist_track WHERE playlist_id = :playlist_id",
+        {"playlist_id": 1},
+    ),
+}
+
+
+def test_seq_scans():
+    plan = {
+        "Node Type": "Nested Loop",
+        "Plans": [
+            {"Node Type": "Seq Scan", "Relation Name": "playlist_track"},
+            {
+                "Node Type": "Index Scan",
+                "Relation Name": "tracks",
+                "Index Name": "tracks_pkey",
+            },
+        ],
+    }
+    assert seq_scans(plan) == ["playlist_track"]
+
+
+@pytest.mark.parametrize("name", JOIN_PATHS)
+def test_join_path_uses_index(name):
+    statement, params = JOIN_PATHS[name]
+    # nothing is run, but the deletes are planned in a transaction that is
+    # rolled back all the same
+    with db.engine.connect() as conn:
+        with conn.begin() as transaction:
+            assert unindexed_tables(conn, statement, params) == []
+            transaction.rollback()
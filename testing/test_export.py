@@ -0,0 +1,27 @@
+import datetime
+import json
+from collections import namedtuple
+
+from src.api.export import ndjson
+
+Row = namedtuple("Row", ["artist_id", "name", "birthdate", "deathdate"])
+
+
+def test_ndjson_one_object_per_line():
+    rows = [
+        Row(1, "Nina Simone", datetime.date(1933, 2, 21), datetime.date(2003, 4, 21)),
+        Row(2, 'Prince "The Artist"', datetime.date(1958, 6, 7), None),
+    ]
+    lines = ndjson(rows).splitlines()
+    assert len(lines) == 2
+    assert json.loads(lines[0]) == {
+        "artist_id": 1,
+        "name": "Nina Simone",
+        "birthdate": "1933-02-21",
+        "deathdate": "2003-04-21",
+    }
+    assert json.loads(lines[1])["deathdate"] is None
+
+
+def test_ndjson_no_rows():
+    assert ndjson([]) == ""
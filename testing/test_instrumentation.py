@@ -0,0 +1,75 @@
+import logging
+
+import sqlalchemy as sa
+from fastapi.testclient import TestClient
+
+from src import instrumentation
+from src.api.server import app
+
+client = TestClient(app)
+
+
+def test_counts_queries_and_checkouts():
+    instrumentation.install()
+    engine = sa.create_engine("sqlite://")
+    stats = instrumentation.RequestStats()
+
+    token = instrumentation.current.set(stats)
+    try:
+        with engine.connect() as conn:
+            conn.execute(sa.text("SELECT 1"))
+            conn.execute(sa.text("SELECT 2"))
+    finally:
+        instrumentation.current.reset(token)
+
+    with engine.connect() as conn:
+        conn.execute(sa.text("SELECT 3"))
+
+    assert stats.queries == 2
+    assert stats.checkouts == 1
+    assert stats.db_time > 0
+
+
+def test_install_twice():
+    instrumentation.install()
+    instrumentation.install()
+    engine = sa.create_engine("sqlite://")
+    stats = instrumentation.RequestStats()
+
+    token = instrumentation.current.set(stats)
+    try:
+        with engine.connect() as conn:
+            conn.execute(sa.text("SELECT 1"))
+    finally:
+        instrumentation.current.reset(token)
+
+    assert stats.queries == 1
+
+
+def test_server_timing_header():
+    response = client.get("/")
+
+    assert response.status_code == 200
+    timing = response.headers["Server-Timing"]
+    assert timing.startswith('db;dur=0.00;desc="0 queries, 0 checkouts", total;dur=')
+
+
+def test_request_log(caplog):
+    with caplog.at_level(logging.INFO, logger="src.instrumentation"):
+        client.get("/tracks/abc")
+
+    record = caplog.records[-1]
+    assert record.levelname == "INFO"
+    assert '"route": "/tracks/{track_id}"' in record.message
+    assert '"status": 422' in record.message
+
+
+def test_request_over_budget(caplog, monkeypatch):
+    monkeypatch.setattr(instrumentation, "TIME_BUDGET", -1)
+
+    with caplog.at_level(logging.INFO, logger="src.instrumentation"):
+        client.get("/")
+
+    record = caplog.records[-1]
+    assert record.levelname == "WARNING"
+    assert '"over_budget"' in record.message
@@ -0,0 +1,80 @@
+import asyncio
+from collections import namedtuple
+
+from src.loaders import AsyncBatchLoader, BatchLoader, Relation
+
+Row = namedtuple("Row", ["key", "artist_id", "name"])
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    def execute(self, statement, params):
+        self.calls.append(params["ids"])
+        return [row for row in self.rows if row.key in params["ids"]]
+
+
+class FakeAsyncConnection(FakeConnection):
+    async def execute(self, statement, params):
+        return FakeConnection.execute(self, statement, params)
+
+
+rows = [
+    Row(1, 10, "The Beatles"),
+    Row(2, 20, "Talking Heads"),
+    Row(1, 30, "Billy Preston"),
+]
+
+
+def test_group_many():
+    relation = Relation("SELECT 1")
+    assert relation.group(rows, [1, 2, 3]) == {
+        1: [
+            {"artist_id": 10, "name": "The Beatles"},
+            {"artist_id": 30, "name": "Billy Preston"},
+        ],
+        2: [{"artist_id": 20, "name": "Talking Heads"}],
+        3: [],
+    }
+
+
+def test_group_one():
+    relation = Relation("SELECT 1", many=False)
+    assert relation.group(rows[1:2], [2, 3]) == {
+        2: {"artist_id": 20, "name": "Talking Heads"},
+        3: None,
+    }
+
+
+def test_loader_batches_and_caches():
+    conn = FakeConnection(rows)
+    loader = BatchLoader(conn, Relation("SELECT 1"))
+
+    result = loader.load_many([1, 2, 1])
+    assert list(result) == [1, 2]
+    assert len(result[1]) == 2
+
+    assert loader.load(2) == [{"artist_id": 20, "name": "Talking Heads"}]
+    assert conn.calls == [[1, 2]]
+
+
+def test_group_drops_repeated_rows_in_order():
+    relation = Relation("SELECT 1", unique="artist_id")
+    repeated = rows + [Row(1, 10, "The Beatles"), Row(1, 40, "Eric Clapton")]
+    assert [r["artist_id"] for r in relation.group(repeated, [1, 2])[1]] == [10, 30, 40]
+
+
+def test_async_loader_batches_and_caches():
+    conn = FakeAsyncConnection(rows)
+    loader = AsyncBatchLoader(conn, Relation("SELECT 1"))
+
+    async def load():
+        result = await loader.load_many([1, 2, 1])
+        return result, await loader.load(2)
+
+    result, artists = asyncio.run(load())
+    assert list(result) == [1, 2]
+    assert artists == [{"artist_id": 20, "name": "Talking Heads"}]
+    assert conn.calls == [[1, 2]]
@@ -0,0 +1,125 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from src import metrics
+from src.api.server import app
+from src.weather import CircuitBreaker, TTLCache, WeatherClient, WeatherUnavailable
+from testing.weather_stub import StubWeatherServer
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(metrics, "registry", [])
+    return metrics.registry
+
+
+def sample(name, **labels):
+    """
+    Returns the value of one sample from /metrics, or None if it is missing.
+    """
+    text = metrics.render()
+    labels = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    prefix = f"{name}{{{labels}}} " if labels else f"{name} "
+    for line in text.splitlines():
+        if line.startswith(prefix):
+            return float(line[len(prefix) :])
+    return None
+
+
+def test_counter(registry):
+    counter = metrics.Counter("lookups_total", "Lookups.", ("cache",))
+    counter.inc("a")
+    counter.inc("a")
+    counter.inc('b"\n', amount=3)
+
+    assert metrics.render().splitlines() == [
+        "# HELP lookups_total Lookups.",
+        "# TYPE lookups_total counter",
+        'lookups_total{cache="a"} 2',
+        'lookups_total{cache="b\\"\\n"} 3',
+    ]
+
+
+def test_histogram(registry):
+    histogram = metrics.Histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+    histogram.observe(0.05)
+    histogram.observe(0.1)
+    histogram.observe(0.5)
+    histogram.observe(5.0)
+
+    assert metrics.render().splitlines()[2:] == [
+        'latency_seconds_bucket{le="0.1"} 2',
+        'latency_seconds_bucket{le="1.0"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        "latency_seconds_sum 5.65",
+        "latency_seconds_count 4",
+    ]
+
+
+def test_gauge_and_callback(registry):
+    gauge = metrics.Gauge("in_flight", "In flight.")
+    gauge.inc()
+    gauge.inc()
+    gauge.dec()
+    metrics.Callback("pool_size", "Pool size.", ("engine",), lambda: {("sync",): 5})
+
+    assert sample("in_flight") == 1
+    assert sample("pool_size", engine="sync") == 5
+
+
+def test_metrics_endpoint(monkeypatch):
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+    client = TestClient(app)
+    before = sample(
+        "http_request_duration_seconds_count", route="/", method="GET", status="200"
+    )
+
+    client.get("/")
+    response = client.get("/metrics", headers={"X-Admin-Token": "secret"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    after = sample(
+        "http_request_duration_seconds_count", route="/", method="GET", status="200"
+    )
+    assert after == (before or 0) + 1
+    # the scrape itself is in flight
+    assert 'http_requests_in_flight{method="GET"} 1\n' in response.text
+
+
+def test_metrics_endpoint_requires_token(monkeypatch):
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+    client = TestClient(app)
+
+    assert client.get("/metrics").status_code == 403
+    response = client.get("/metrics", headers={"X-Admin-Token": "wrong"})
+    assert response.status_code == 403
+
+
+def test_weather_metrics():
+    stub = StubWeatherServer(status=503).start()
+    try:
+        client = WeatherClient(
+            base_url=stub.url,
+            cache=TTLCache(),
+            breaker=CircuitBreaker(threshold=1, reset_timeout=60),
+            shared_cache=False,
+        )
+        failed = sample("weather_errors_total", client="sync", reason="failed") or 0
+        circuit_open = (
+            sample("weather_errors_total", client="sync", reason="circuit_open") or 0
+        )
+        misses = sample("cache_lookups_total", cache="weather", result="miss") or 0
+
+        for _ in range(2):
+            with pytest.raises(WeatherUnavailable):
+                client.get("San Luis Obispo")
+    finally:
+        stub.stop()
+
+    assert sample("weather_errors_total", client="sync", reason="failed") == failed + 1
+    assert (
+        sample("weather_errors_total", client="sync", reason="circuit_open")
+        == circuit_open + 1
+    )
+    assert sample("cache_lookups_total", cache="weather", result="miss") == misses + 2
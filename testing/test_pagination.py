@@ -0,0 +1,51 @@
+import pytest
+from fastapi import HTTPException
+
+from src.pagination import encode_cursor, decode_cursor, keyset, default_sort, ListSort
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor(["abbey road", 12, 3])
+    assert decode_cursor(cursor, [str, int, int]) == ["abbey road", 12, 3]
+
+
+def test_invalid_cursor():
+    for cursor in ["not a cursor", encode_cursor([1]), encode_cursor({"a": 1})]:
+        with pytest.raises(HTTPException):
+            decode_cursor(cursor, [int, int])
+
+
+def test_cursor_with_wrong_types():
+    for values in [["x", "y"], [1, "y"], [1.5, 2], [True, 2], [None, 2]]:
+        with pytest.raises(HTTPException):
+            decode_cursor(encode_cursor(values), [int, int])
+
+
+def test_cursor_rank_may_be_whole():
+    assert decode_cursor(encode_cursor([-1, 2]), [float, int]) == [-1, 2]
+
+
+def test_keyset_first_page():
+    assert keyset([("t.track_id", int)], None) == ("TRUE", "t.track_id", {})
+
+
+def test_keyset_after_cursor():
+    where, order_by, params = keyset(
+        [("t.title", str), ("t.track_id", int)], encode_cursor(["a", 1])
+    )
+    assert where == (
+        "t.title >= :cursor_0 AND (t.title, t.track_id) > (:cursor_0, :cursor_1)"
+    )
+    assert order_by == "t.title, t.track_id"
+    assert params == {"cursor_0": "a", "cursor_1": 1}
+
+
+def test_keyset_single_key():
+    where, _, _ = keyset([("artist_id", int)], encode_cursor([7]))
+    assert where == "(artist_id) > (:cursor_0)"
+
+
+def test_default_sort():
+    assert default_sort(None, "") == ListSort.id
+    assert default_sort(None, "beat") == ListSort.relevance
+    assert default_sort(ListSort.name, "beat") == ListSort.name
@@ -78,4 +78,20 @@ def test_add_track_to_playlist_fail_2():
     assert response.status_code == 405
 
 
+def test_generate_bad_mood():
+    response = client.get("/playlists/generate/?mood=grumpy")
+    assert response.status_code == 422
+    assert response.json()["detail"] == "Invalid vibe."
+
+
+def test_update_playlist_tracks_bad_ids():
+    response = client.patch("/playlists/1/tracks", json={"add": ["bad"]})
+    assert response.status_code == 422
 
+
+def test_update_playlist_tracks_too_many():
+    response = client.patch(
+        "/playlists/1/tracks",
+        json={"add": list(range(600)), "remove": list(range(600))},
+    )
+    assert response.status_code == 422
@@ -0,0 +1,98 @@
+import os
+
+import pytest
+
+from src.explain import shape
+from testing import query_plans
+
+
+def summary(seq_scans=(), cost=10.0, budget=20.0, shape=("Seq Scan on tracks",)):
+    return {
+        "request": "GET /tracks/",
+        "shape": list(shape),
+        "seq_scans": list(seq_scans),
+        "cost": cost,
+        "shared_hit": 1,
+        "shared_read": 0,
+        "budget": budget,
+    }
+
+
+def test_shape():
+    plan = {
+        "Node Type": "Nested Loop",
+        "Plans": [
+            {"Node Type": "Seq Scan", "Relation Name": "tracks"},
+            {
+                "Node Type": "Index Only Scan",
+                "Index Name": "ix_track_artist_artist_id_track_id",
+                "Relation Name": "track_artist",
+            },
+        ],
+    }
+
+    assert shape(plan) == [
+        "Nested Loop",
+        "  Seq Scan on tracks",
+        "  Index Only Scan using ix_track_artist_artist_id_track_id on track_artist",
+    ]
+
+
+def test_compare_unchanged():
+    baseline = {"SELECT 1": summary()}
+
+    assert query_plans.compare(baseline, {"SELECT 1": summary()}) == ([], [])
+
+
+def test_compare_new_seq_scan():
+    baseline = {"SELECT 1": summary()}
+    current = {"SELECT 1": summary(seq_scans=["tracks"], shape=["Seq Scan"])}
+
+    problems, notes = query_plans.compare(baseline, current)
+
+    assert len(problems) == 1
+    assert "now scans tracks sequentially" in problems[0]
+    assert notes == []
+
+
+def test_compare_over_budget():
+    baseline = {"SELECT 1": summary()}
+
+    problems, _ = query_plans.compare(baseline, {"SELECT 1": summary(cost=25.0)})
+
+    assert len(problems) == 1
+    assert "over its budget of 20.0" in problems[0]
+
+
+def test_compare_changed_shape_within_budget():
+    baseline = {"SELECT 1": summary()}
+    current = {"SELECT 1": summary(shape=["Index Scan using tracks_pkey on tracks"])}
+
+    problems, notes = query_plans.compare(baseline, current)
+
+    assert problems == []
+    assert "plan changed" in notes[0]
+
+
+def test_compare_new_and_dropped_statements():
+    baseline = {"SELECT 1": summary()}
+
+    problems, notes = query_plans.compare(baseline, {"SELECT 2": summary()})
+
+    assert "not in the baseline" in problems[0]
+    assert "was not run" in notes[0]
+
+
+def test_query_plans():
+    if not query_plans.database_reachable():
+        pytest.skip("no database to check the query plans against")
+    assert os.path.exists(query_plans.BASELINE), (
+        "no query plan baseline, record one with python -m testing.query_plans "
+        "--update"
+    )
+
+    current, failures = query_plans.run()
+    problems, _ = query_plans.compare(query_plans.load_baseline(), current)
+
+    assert failures == []
+    assert problems == []
@@ -0,0 +1,37 @@
+import pytest
+from fastapi import HTTPException
+
+from src.scoring import get_score, score_many, WeatherRatings
+
+ratings = {"Clear": 400, "Moderate rain": 160, "Heavy snow": 35}
+
+
+def test_get_score():
+    assert get_score("Clear", "13:00", 80, "chill", ratings) == 308.5
+    assert get_score("Moderate rain", "19:00", 50, "FoCUS", ratings) == 132.75
+
+
+def test_get_score_invalid():
+    with pytest.raises(HTTPException):
+        get_score("Clear", "13:00", 80, "downbad", ratings)
+
+    with pytest.raises(HTTPException):
+        get_score("Volcanic ash", "13:00", 80, "chill", ratings)
+
+
+def test_score_many_matches_get_score():
+    conditions = [
+        ("Clear", "13:00", 80, "chill"),
+        ("Moderate rain", "19:00", 50, "focus"),
+        ("Heavy snow", "01:00", 5, "heartbroken"),
+        ("Clear", "06:00", 62.5, "party"),
+    ]
+    scores = score_many(conditions, ratings)
+    assert list(scores) == [get_score(*c, ratings) for c in conditions]
+
+
+def test_weather_ratings_immutable():
+    weather_ratings = WeatherRatings()
+    weather_ratings.load(ratings.items())
+    with pytest.raises(TypeError):
+        weather_ratings.get()["Clear"] = 0
@@ -0,0 +1,119 @@
+import json
+import logging
+
+import pytest
+import sqlalchemy as sa
+from fastapi.testclient import TestClient
+
+from src import slow_queries
+from src.api.server import app
+from src.slow_queries import SlowQueryLog, fingerprint, loggable, pyformat
+
+client = TestClient(app)
+
+
+def test_fingerprint_strips_values():
+    _, first = fingerprint(
+        "SELECT * FROM tracks WHERE track_id = %(track_id)s AND title = 'a' LIMIT 10"
+    )
+    _, second = fingerprint(
+        "SELECT *  FROM tracks\n"
+        " WHERE track_id = %(track_id)s AND title = 'b''c' LIMIT 5"
+    )
+
+    expected = "SELECT * FROM tracks WHERE track_id = ? AND title = ? LIMIT ?"
+    assert first == second == expected
+
+
+def test_fingerprint_collapses_lists():
+    _, first = fingerprint("SELECT 1 FROM t WHERE a IN ($1, $2) AND b = $3::INTEGER")
+    _, second = fingerprint("SELECT 1 FROM t WHERE a IN ($1) AND b = $2::INTEGER")
+
+    assert first == second == "SELECT ? FROM t WHERE a IN (?) AND b = ?::INTEGER"
+
+
+def test_fingerprint_keeps_identifiers():
+    _, normalized = fingerprint("SELECT t1.track_id FROM tracks AS t1 -- by id")
+
+    assert normalized == "SELECT t1.track_id FROM tracks AS t1"
+
+
+def test_loggable_redacts_passwords():
+    assert loggable({"username": "geoff", "password": "hunter22"}) == {
+        "username": "geoff",
+        "password": "<redacted>",
+    }
+    assert loggable([(1, "a"), (2, "b")]) == ["1", "a"]
+
+
+def test_pyformat():
+    assert pyformat("SELECT $2 + $1 WHERE a LIKE 'x%'", (1, 2)) == (
+        "SELECT %s + %s WHERE a LIKE 'x%%'",
+        (2, 1),
+    )
+
+
+def test_records_statements():
+    log = SlowQueryLog(threshold=10_000)
+    engine = sa.create_engine("sqlite://")
+    log.install()
+    try:
+        with engine.connect() as conn:
+            for i in range(3):
+                conn.execute(sa.text("SELECT :i UNION ALL SELECT 2"), {"i": i})
+    finally:
+        log.uninstall()
+
+    [summary] = log.summary()
+    assert summary["statement"] == "SELECT ? UNION ALL SELECT ?"
+    assert summary["count"] == 3
+    assert summary["max_ms"] >= summary["p95_ms"] >= summary["p50_ms"] > 0
+    assert summary["slowest"] is None
+
+
+def test_table_is_bounded():
+    log = SlowQueryLog(threshold=10_000, max_fingerprints=2)
+    log.record("SELECT a FROM t", {}, 0.5, 1)
+    log.record("SELECT b FROM t", {}, 0.1, 1)
+    log.record("SELECT c FROM t", {}, 0.3, 1)
+
+    assert [s["statement"] for s in log.summary()] == [
+        "SELECT a FROM t",
+        "SELECT c FROM t",
+    ]
+
+
+def test_logs_slow_statements(caplog, monkeypatch):
+    log = SlowQueryLog(threshold=100)
+    monkeypatch.setattr(log, "plan", lambda *args: [{"Plan": {"Node Type": "Result"}}])
+
+    with caplog.at_level(logging.WARNING, logger="src.slow_queries"):
+        log.record("SELECT %(a)s", {"a": 1}, 0.05, 1)
+        log.record("SELECT %(a)s", {"a": 2}, 0.2, 1)
+        log.flush()
+
+    [record] = caplog.records
+    dump = json.loads(record.message)
+    assert dump["ms"] == 200
+    assert dump["parameters"] == {"a": "2"}
+    assert dump["plan"] == [{"Plan": {"Node Type": "Result"}}]
+    assert log.summary()[0]["slowest"] == {"ms": 200, "parameters": {"a": "2"}}
+
+
+def test_admin_requires_token(monkeypatch):
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+
+    response = client.get("/admin/slow-queries", headers={"X-Admin-Token": "wrong"})
+
+    assert response.status_code == 403
+    assert response.json() == {"detail": "Invalid admin token."}
+
+
+@pytest.mark.parametrize("enabled, status", [(False, 404), (True, 200)])
+def test_admin_slow_queries(monkeypatch, enabled, status):
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(slow_queries, "ENABLED", enabled)
+
+    response = client.get("/admin/slow-queries", headers={"X-Admin-Token": "secret"})
+
+    assert response.status_code == status
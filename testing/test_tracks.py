@@ -55,3 +55,85 @@ def test_post_track_fail_2():
         },
     )
     assert response.status_code == 422
+
+
+def test_list_tracks_bad_sort():
+    response = client.get("/tracks?sort=runtime")
+    assert response.status_code == 422
+
+
+def test_add_tracks_bulk_invalid_rows():
+    body = "\n".join(
+        [
+            json.dumps(
+                {
+                    "title": "a",
+                    "runtime": 0,
+                    "genre": "rock",
+                    "release_date": "2020-01-01",
+                    "artist_ids": [],
+                    "vibe_score": 10,
+                }
+            ),
+            json.dumps({"title": "b"}),
+        ]
+    )
+    response = client.post(
+        "/tracks/bulk", content=body, headers={"content-type": "application/x-ndjson"}
+    )
+    assert response.status_code == 200
+    assert response.json() == [
+        {"track_id": None, "error": "Runtime cannot be null or less than 1."},
+        {"track_id": None, "error": "runtime: field required"},
+    ]
+
+
+def test_add_tracks_bulk_invalid_json_line():
+    body = "\n".join(['{"title": "a"', json.dumps({"title": "b"})])
+    response = client.post(
+        "/tracks/bulk", content=body, headers={"content-type": "application/x-ndjson"}
+    )
+    assert response.status_code == 200
+    first, second = response.json()
+    assert first["track_id"] is None
+    assert first["error"].startswith("Not valid JSON: Expecting ',' delimiter")
+    assert second == {"track_id": None, "error": "runtime: field required"}
+
+
+def bulk_track(**fields):
+    return {
+        "title": "bulk test",
+        "runtime": 200,
+        "genre": "rock",
+        "release_date": "2020-01-01",
+        "artist_ids": [1],
+        "vibe_score": 10,
+        **fields,
+    }
+
+
+def test_add_tracks_bulk_without_artists():
+    response = client.post("/tracks/bulk", json=[bulk_track(artist_ids=[])])
+    assert response.status_code == 200
+    assert response.json() == [
+        {"track_id": None, "error": "A track needs at least one artist."}
+    ]
+
+
+def test_add_tracks_bulk_database_error_fails_only_its_track():
+    # the runtime passes validation but does not fit in an integer column
+    tracks = [bulk_track(), bulk_track(runtime=2**40), bulk_track()]
+    response = client.post("/tracks/bulk", json=tracks)
+    assert response.status_code == 200
+
+    first, bad, last = response.json()
+    assert first["error"] is None and first["track_id"] is not None
+    assert last["error"] is None and last["track_id"] is not None
+    assert bad["track_id"] is None
+    assert bad["error"].startswith("Track could not be added: ")
+    assert "out of range" in bad["error"]
+
+
+def test_add_tracks_bulk_not_a_list():
+    response = client.post("/tracks/bulk", json={"title": "a"})
+    assert response.status_code == 400
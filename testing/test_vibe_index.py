@@ -0,0 +1,69 @@
+from src.vibe_index import VibeIndex, AlbumStats
+
+
+def make_index():
+    index = VibeIndex()
+    index.load([(1, 10), (2, 50), (3, 20), (4, 400), (5, 30)])
+    return index
+
+
+def test_nearest():
+    index = make_index()
+    assert index.nearest(22, 3) == [3, 5, 1]
+
+
+def test_nearest_ties_prefer_lower_score():
+    index = make_index()
+    assert index.nearest(15, 2) == [1, 3]
+
+
+def test_nearest_out_of_range():
+    index = make_index()
+    assert index.nearest(1000, 2) == [4, 2]
+    assert index.nearest(-5, 2) == [1, 3]
+
+
+def test_nearest_more_than_catalog():
+    index = make_index()
+    assert sorted(index.nearest(100, 10)) == [1, 2, 3, 4, 5]
+
+
+def test_add():
+    index = make_index()
+    index.add(6, 21)
+    assert index.nearest(22, 2) == [6, 3]
+    assert len(index) == 6
+
+
+def make_album_stats():
+    stats = AlbumStats()
+    # (album_id, vibe_sum, track_count)
+    stats.load([(1, 1000, 10), (2, 600, 6), (3, 1200, 8), (4, 800, 4)])
+    return stats
+
+
+def test_album_nearest():
+    stats = make_album_stats()
+    assert stats.nearest(140, 10) == 3
+    assert stats.nearest(210, 10) == 4
+
+
+def test_album_nearest_ties_by_track_count():
+    stats = make_album_stats()
+    assert stats.nearest(100, 10) == 1
+    assert stats.nearest(100, 5) == 2
+
+
+def test_album_add():
+    stats = make_album_stats()
+    stats.add(4, 0)
+    assert stats.nearest(160, 10) == 4
+    stats.add(5, 50)
+    assert stats.nearest(0, 1) == 5
+    assert len(stats) == 5
+
+
+def test_album_nearest_empty():
+    stats = AlbumStats()
+    stats.load([])
+    assert stats.nearest(100, 10) is None
@@ -0,0 +1,171 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.weather import normalize_location, TTLCache, SingleFlight, WeatherUnavailable
+from testing.weather_stub import StubWeatherServer
+
+
+def test_normalize_location():
+    assert normalize_location("  San   Luis Obispo ") == "san luis obispo"
+    assert normalize_location("35.28281, -120.65962") == "35.28,-120.66"
+    assert normalize_location("93401") == "93401"
+
+
+def test_cache_expires():
+    cache = TTLCache(ttl=0.05)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    time.sleep(0.1)
+    assert cache.get("a") is None
+
+
+def test_cache_drops_entries_set_without_stale():
+    cache = TTLCache(ttl=0.05, stale_ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2, stale=False)
+    time.sleep(0.1)
+    assert cache.get_entry("a") == (1, False)
+    assert cache.get_entry("b") is None
+
+
+def test_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+
+
+def test_single_flight():
+    flight = SingleFlight()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.1)
+        return "sunny"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(flight.do("slo", slow)))
+        for _ in range(5)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert results == ["sunny"] * 5
+
+
+def make_client(stub, **kwargs):
+    from src.weather import WeatherClient, CircuitBreaker
+
+    return WeatherClient(
+        base_url=stub.url,
+        read_timeout=0.2,
+        cache=kwargs.pop("cache", TTLCache(stale_ttl=60)),
+        breaker=kwargs.pop("breaker", CircuitBreaker(threshold=2, reset_timeout=60)),
+        shared_cache=False,
+        **kwargs,
+    )
+
+
+def test_client_async_caches():
+    stub = StubWeatherServer().start()
+    try:
+        client = make_client(stub)
+
+        async def run():
+            results = await asyncio.gather(
+                *[client.get_async("San Luis Obispo") for _ in range(10)]
+            )
+            await client.aclose()
+            return results
+
+        results = asyncio.run(run())
+        assert results[0]["weather"] == "Sunny"
+        assert stub.requests == 1
+    finally:
+        stub.stop()
+
+
+def test_client_unknown_location():
+    stub = StubWeatherServer().start()
+    try:
+        client = make_client(stub)
+        assert client.get("nowhere") == {"error": "No matching location found."}
+    finally:
+        stub.stop()
+
+
+def test_client_timeout_opens_circuit():
+    stub = StubWeatherServer(delay=0.5).start()
+    try:
+        client = make_client(stub)
+        for location in ("a", "b", "c"):
+            with pytest.raises(WeatherUnavailable):
+                client.get(location)
+
+        # the third call failed fast without reaching the provider
+        assert client.breaker.is_open
+        assert stub.requests == 2
+    finally:
+        stub.stop()
+
+
+def test_client_serves_stale_while_provider_down():
+    stub = StubWeatherServer().start()
+    try:
+        client = make_client(stub, cache=TTLCache(ttl=0, stale_ttl=60))
+        fresh = client.get("Fresno")
+
+        stub.status = 503
+        assert client.get("Fresno") == fresh
+    finally:
+        stub.stop()
+
+
+def test_client_unexpected_response_counts_as_failure():
+    from src.weather import CircuitBreaker
+
+    stub = StubWeatherServer().start()
+    try:
+        client = make_client(stub, breaker=CircuitBreaker(threshold=1, reset_timeout=0))
+        with pytest.raises(WeatherUnavailable):
+            client.get("garbled")
+        assert client.breaker.is_open
+
+        # the trial call after the reset timeout closes the circuit again
+        assert client.get("Fresno")["weather"] == "Sunny"
+        assert not client.breaker.is_open
+    finally:
+        stub.stop()
+
+
+def test_client_async_unexpected_response_counts_as_failure():
+    from src.weather import CircuitBreaker
+
+    stub = StubWeatherServer().start()
+    try:
+        client = make_client(stub, breaker=CircuitBreaker(threshold=1, reset_timeout=0))
+
+        async def run():
+            try:
+                with pytest.raises(WeatherUnavailable):
+                    await client.get_async("garbled")
+                assert client.breaker.is_open
+                return await client.get_async("Fresno")
+            finally:
+                await client.aclose()
+
+        assert asyncio.run(run())["weather"] == "Sunny"
+        assert not client.breaker.is_open
+    finally:
+        stub.stop()
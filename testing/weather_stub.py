@@ -0,0 +1,104 @@
+"""
+Local stand-in for the weatherapi.com current weather endpoint, used by the
+weather client tests and for benchmarking with a slow or failing provider.
+
+    python -m testing.weather_stub --port 8081 --delay 0.5
+
+then run the API with WEATHER_API_URL=http://127.0.0.1:8081
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class StubWeatherServer:
+    def __init__(self, port=0, delay=0.0, status=200):
+        self.delay = delay
+        self.status = status
+        self.requests = 0
+        self._server = _Server(("127.0.0.1", port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests += 1
+                time.sleep(stub.delay)
+
+                query = parse_qs(urlparse(self.path).query)
+                location = query.get("q", [""])[0]
+
+                if stub.status >= 500:
+                    status, body = stub.status, {}
+                elif location == "garbled":
+                    status, body = 200, {"location": {"name": location}}
+                elif location == "nowhere":
+                    status = 400
+                    body = {
+                        "error": {
+                            "code": 1006,
+                            "message": "No matching location found.",
+                        }
+                    }
+                else:
+                    status = 200
+                    body = {
+                        "location": {"name": location, "localtime": "2023-06-05 13:00"},
+                        "current": {
+                            "temp_f": 72.0,
+                            "wind_mph": 5.0,
+                            "condition": {"text": "Sunny"},
+                        },
+                    }
+
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds per response")
+    parser.add_argument("--status", type=int, default=200, help="force an error status")
+    args = parser.parse_args()
+
+    stub = StubWeatherServer(args.port, args.delay, args.status)
+    print(f"Stub weather provider listening on {stub.url}")
+    stub._server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()